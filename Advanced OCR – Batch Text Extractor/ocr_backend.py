@@ -0,0 +1,202 @@
+"""
+ocr_backend.py
+Recognition backends that keep a Tesseract engine alive between images.
+
+With tesserocr installed, each worker holds one PyTessBaseAPI per language,
+so traineddata is loaded once and images are handed over in memory. Without
+it we fall back to running the tesseract binary per image, which reloads the
+models every time: only the tesserocr backend is a persistent engine.
+
+Both backends accept the raw uint8 buffer produced by OpenCV together with
+its dimensions and DPI (recognize_raw): there is no PIL round-trip, no PNG
+encode and no temporary file. The subprocess backend streams the pixels to
+`tesseract stdin stdout` behind a PNM header.
+
+recognize_data additionally returns Tesseract's per-word confidences (0-100),
+which the two-pass mode uses to decide what needs full preprocessing, and
+recognize_words every word's box, confidence and block/line numbers as an
+ocr_words.WordBoxes table, from the same recognition pass as the text.
+
+Optional dependency:
+    pip install tesserocr
+"""
+
+import os
+import subprocess
+import threading
+
+import pytesseract
+import numpy as np
+
+import ocr_words
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Modify the path below if Tesseract is installed elsewhere on Windows
+if os.name == 'nt':
+    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+DEFAULT_PSM = 3
+
+
+def tesseract_config(lang, psm=DEFAULT_PSM):
+    """Effective Tesseract config string for a language (also part of the cache key)"""
+    return f'--oem 3 --psm {psm} -l {lang}'
+
+
+def installed_languages():
+    """Language codes Tesseract has traineddata for, or None if they can't be listed"""
+    try:
+        if tesserocr:
+            langs = tesserocr.get_languages()[1]
+        else:
+            langs = pytesseract.get_languages(config='')
+    except Exception:
+        return None
+    return set(langs) or None
+
+
+def _to_array(image):
+    """Accept either a NumPy array from OpenCV or a PIL image; return a C-contiguous
+    uint8 array (grayscale or RGB) and the number of bytes copied to get there"""
+    copied = 0
+    if not isinstance(image, np.ndarray):
+        if image.mode not in ("L", "RGB"):
+            image = image.convert("RGB")
+        image = np.asarray(image)
+        copied += image.nbytes
+    if image.dtype != np.uint8 or not image.flags['C_CONTIGUOUS']:
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        copied += image.nbytes
+    return image, copied
+
+
+class TesserocrBackend:
+    """Long-lived Tesseract engine driven through the C API"""
+    
+    name = "tesserocr"
+    
+    def __init__(self, lang):
+        self.lang = lang
+        self.lock = threading.Lock()
+        self.api = tesserocr.PyTessBaseAPI(lang=lang, oem=tesserocr.OEM.DEFAULT,
+                                           psm=DEFAULT_PSM)
+    
+    def recognize_raw(self, image, psm=DEFAULT_PSM, dpi=None):
+        """OCR a raw pixel buffer; returns (text, bytes_copied)"""
+        text, _, copied = self._recognize(image, psm, dpi, confidences=False)
+        return text, copied
+    
+    def recognize_data(self, image, psm=DEFAULT_PSM, dpi=None):
+        """OCR a raw pixel buffer; returns (text, word confidences, bytes_copied)"""
+        return self._recognize(image, psm, dpi, confidences=True)
+    
+    def recognize_words(self, image, psm=DEFAULT_PSM, dpi=None):
+        """OCR a raw pixel buffer; returns (text rebuilt from the words, WordBoxes, bytes_copied)"""
+        tsv, _, copied = self._recognize(image, psm, dpi, confidences=False, tsv=True)
+        return (*ocr_words.from_tsv(tsv), copied)
+    
+    def _recognize(self, image, psm, dpi, confidences, tsv=False):
+        pixels, copied = _to_array(image)
+        height, width = pixels.shape[:2]
+        bpp = 1 if pixels.ndim == 2 else pixels.shape[2]
+        
+        # SetImageBytes only takes bytes, so this is the one unavoidable copy
+        data = pixels.tobytes()
+        copied += len(data)
+        
+        with self.lock:
+            self.api.SetPageSegMode(psm)
+            self.api.SetImageBytes(data, width, height, bpp, width * bpp)
+            if dpi:
+                self.api.SetSourceResolution(int(dpi))
+            text = self.api.GetTSVText(0) if tsv else self.api.GetUTF8Text()
+            confs = list(self.api.AllWordConfidences()) if confidences else None
+            return text, confs, copied
+    
+    def close(self):
+        self.api.End()
+
+
+class PytesseractBackend:
+    """Fallback: one tesseract subprocess per image, fed through a pipe"""
+    
+    name = "pytesseract"
+    
+    def __init__(self, lang):
+        self.lang = lang
+    
+    def recognize_raw(self, image, psm=DEFAULT_PSM, dpi=None):
+        """OCR a raw pixel buffer; returns (text, bytes_copied)"""
+        return self._run(image, psm, dpi)
+    
+    def recognize_data(self, image, psm=DEFAULT_PSM, dpi=None):
+        """OCR a raw pixel buffer; returns (text, word confidences, bytes_copied)"""
+        text, words, copied = self.recognize_words(image, psm, dpi)
+        return text, words.conf.tolist(), copied
+    
+    def recognize_words(self, image, psm=DEFAULT_PSM, dpi=None):
+        """OCR a raw pixel buffer; returns (text, WordBoxes, bytes_copied).
+        
+        Asks tesseract for TSV output (what image_to_data parses) and rebuilds
+        the text from its words: one line per text line, a blank line between
+        paragraphs.
+        """
+        tsv, copied = self._run(image, psm, dpi, 'tsv')
+        return (*ocr_words.from_tsv(tsv), copied)
+    
+    def _run(self, image, psm, dpi, *configfiles):
+        pixels, copied = _to_array(image)
+        height, width = pixels.shape[:2]
+        magic = b'P5' if pixels.ndim == 2 else b'P6'
+        header = b'%s\n%d %d\n255\n' % (magic, width, height)
+        
+        cmd = [pytesseract.pytesseract.tesseract_cmd, 'stdin', 'stdout',
+               *tesseract_config(self.lang, psm).split()]
+        if dpi:
+            cmd += ['--dpi', str(int(dpi))]
+        cmd += configfiles
+        
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        try:
+            # Write the buffer straight from the array's memory
+            proc.stdin.write(header)
+            proc.stdin.write(memoryview(pixels).cast('B'))
+        except BrokenPipeError:
+            pass
+        out, err = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(err.decode('utf-8', 'replace').strip() or
+                               f"tesseract exited with status {proc.returncode}")
+        return out.decode('utf-8'), copied + pixels.nbytes
+    
+    def close(self):
+        pass
+
+
+# One engine per language, per thread (a process-pool worker has just one thread;
+# the staged pipeline runs several recognition threads side by side)
+_local = threading.local()
+
+
+def get_backend(lang):
+    """Return this thread's cached backend for lang, creating it on first use"""
+    backends = getattr(_local, "backends", None)
+    if backends is None:
+        backends = _local.backends = {}
+    backend = backends.get(lang)
+    if backend is None:
+        backend = TesserocrBackend(lang) if tesserocr else PytesseractBackend(lang)
+        backends[lang] = backend
+    return backend
+
+
+def close_thread_backends():
+    """Shut down this thread's engines; for threads that exit while the process lives on"""
+    for backend in getattr(_local, "backends", {}).values():
+        backend.close()
+    _local.backends = {}
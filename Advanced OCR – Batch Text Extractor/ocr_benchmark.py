@@ -0,0 +1,320 @@
+"""
+ocr_benchmark.py
+Reproducible throughput / accuracy benchmark for the OCR pipeline.
+
+It can render a synthetic corpus of known text with varied fonts, noise,
+skew, blur and DPI (ground truth is written next to every image as
+`<stem>.gt.txt`), then runs each pipeline configuration over a corpus and
+reports images per second, CPU-seconds per image, peak memory, per-step
+latencies and character / word error rates. Results are saved as JSON so
+runs can be compared, which lets a speed-up be weighed against any
+accuracy it costs.
+
+Images without a ground-truth file are scored against the `max` profile's
+output instead.
+
+Usage:
+    python ocr_benchmark.py --synthetic 40 --corpus-dir synth/ --save-dir bench_results/
+    python ocr_benchmark.py samples/ --configs fast auto max --compare bench_results/last.json
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+import ocr_engine
+from ocr_cli import collect_inputs
+from ocr_metrics import BatchReport, peak_rss_bytes
+
+# Named pipeline configurations the benchmark can run
+CONFIGS = {
+    "raw": ocr_engine.OCRSettings(preprocess=False),
+    "fast": ocr_engine.OCRSettings(profile="fast"),
+    "balanced": ocr_engine.OCRSettings(profile="balanced"),
+    "max": ocr_engine.OCRSettings(profile="max"),
+    "auto": ocr_engine.OCRSettings(profile="auto"),
+    "unscaled": ocr_engine.OCRSettings(profile="auto", normalize=False),
+    "layout": ocr_engine.OCRSettings(profile="auto", layout=True),
+    "two-pass": ocr_engine.OCRSettings(profile="max", two_pass=True),
+}
+
+WORDS = (
+    "invoice total amount due payment date account number customer order quantity price "
+    "description shipping address reference balance receipt tax subtotal delivery service "
+    "the of and to in for on with by from report summary page section table figure chapter "
+    "quick brown fox jumps over lazy dog system network document scanner contract signature"
+).split()
+
+FONTS = (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX, cv2.FONT_HERSHEY_COMPLEX,
+         cv2.FONT_HERSHEY_TRIPLEX, cv2.FONT_HERSHEY_PLAIN)
+
+NOISE_LEVELS = (0, 4, 10, 20)
+SKEW_DEGREES = (0.0, 0.0, 1.5, -1.5, 4.0)
+BLUR_KERNELS = (0, 0, 3, 5)
+DPIS = (150, 200, 300)
+
+
+# ---- synthetic corpus ----
+
+def render_sample(rng, dpi, font, noise, skew, blur):
+    """Render random text lines as a degraded page; returns (BGR image, text)"""
+    scale = dpi / 300.0
+    font_scale = 1.1 * scale
+    thickness = max(1, int(round(2 * scale)))
+    line_height = int(60 * scale)
+    margin = int(40 * scale)
+    
+    lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 8)))
+             for _ in range(rng.randint(3, 8))]
+    width = max(cv2.getTextSize(line, font, font_scale, thickness)[0][0] for line in lines)
+    width += 2 * margin
+    height = line_height * len(lines) + 2 * margin
+    
+    img = np.full((height, width), 255, np.uint8)
+    for n, line in enumerate(lines):
+        y = margin + line_height * (n + 1) - line_height // 4
+        cv2.putText(img, line, (margin, y), font, font_scale, 0, thickness, cv2.LINE_AA)
+    
+    if skew:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), skew, 1.0)
+        img = cv2.warpAffine(img, matrix, (width, height), borderValue=255)
+    if blur:
+        img = cv2.GaussianBlur(img, (blur, blur), 0)
+    if noise:
+        noisy = img.astype(np.float32) + np.random.default_rng(rng.getrandbits(32)).normal(0, noise, img.shape)
+        img = np.clip(noisy, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR), "\n".join(lines)
+
+
+def render_corpus(out_dir, count, seed=0):
+    """Write `count` synthetic images plus .gt.txt files and a manifest; returns the paths"""
+    from PIL import Image
+    
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    manifest = []
+    paths = []
+    for n in range(count):
+        params = {
+            "dpi": rng.choice(DPIS),
+            "font": rng.choice(FONTS),
+            "noise": rng.choice(NOISE_LEVELS),
+            "skew": rng.choice(SKEW_DEGREES),
+            "blur": rng.choice(BLUR_KERNELS),
+        }
+        img, text = render_sample(rng, **params)
+        stem = os.path.join(out_dir, f"synth_{n:04d}")
+        # Save through PIL so the DPI lands in the file header
+        Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)).save(
+            stem + ".png", dpi=(params["dpi"], params["dpi"]))
+        with open(stem + ".gt.txt", 'w', encoding='utf-8') as f:
+            f.write(text)
+        manifest.append({"image": os.path.basename(stem + ".png"), **params})
+        paths.append(stem + ".png")
+    
+    with open(os.path.join(out_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump({"seed": seed, "images": manifest}, f, indent=2)
+    return paths
+
+
+# ---- scoring ----
+
+def levenshtein(a, b):
+    """Edit distance between two sequences"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def normalise(text):
+    return " ".join(text.split())
+
+
+def char_error_rate(hypothesis, reference):
+    reference = normalise(reference)
+    if not reference:
+        return 0.0 if not normalise(hypothesis) else 1.0
+    return levenshtein(normalise(hypothesis), reference) / len(reference)
+
+
+def word_error_rate(hypothesis, reference):
+    reference = reference.split()
+    if not reference:
+        return 0.0 if not hypothesis.split() else 1.0
+    return levenshtein(hypothesis.split(), reference) / len(reference)
+
+
+def ground_truth(image_path):
+    path = os.path.splitext(image_path)[0] + ".gt.txt"
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    return None
+
+
+# ---- running ----
+
+def cpu_seconds():
+    """CPU time of this process plus reaped children (tesseract subprocesses)"""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def run_config(images, settings):
+    """OCR every image under one configuration; returns (texts, metrics)"""
+    report = BatchReport()
+    texts = []
+    errors = 0
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    for image_path in images:
+        text, stats = ocr_engine.extract_text_stats(image_path, settings)
+        if text.startswith(ocr_engine.ERROR_PREFIX):
+            errors += 1
+        texts.append(text)
+        report.add(os.path.basename(image_path), stats)
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+    report.finish()
+    
+    summary = report.summary()
+    count = len(images)
+    return texts, {
+        "images": count,
+        "errors": errors,
+        "wall_s": wall,
+        "images_per_sec": count / wall if wall > 0 else 0.0,
+        "cpu_s_per_image": cpu / count if count else 0.0,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "steps": summary["steps"],
+    }
+
+
+def run_config_isolated(images, settings):
+    """run_config in a fresh process; returns (texts, metrics).
+    
+    Peak RSS is a high-water mark for the whole process, so configurations
+    sharing one would all report the heaviest one run before them. A spawned
+    (not forked) process starts from nothing, so its peak is this config's own.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=ocr_engine.init_worker,
+                             initargs=settings.languages()) as pool:
+        # Warm up OpenCV and the recognizer so the timings aren't charged for it
+        pool.submit(ocr_engine.extract_text_stats, images[0], settings).result()
+        return pool.submit(run_config, images, settings).result()
+
+
+def benchmark(images, config_names, lang="eng"):
+    """Run every configuration and score it; returns {config: metrics}"""
+    configs = {name: ocr_engine.OCRSettings(**{**CONFIGS[name].__dict__, "lang": lang})
+               for name in config_names}
+    references = [ground_truth(path) for path in images]
+    if any(ref is None for ref in references) and "max" not in configs:
+        configs["max"] = ocr_engine.OCRSettings(profile="max", lang=lang)
+    
+    outputs = {}
+    results = {}
+    for name, settings in configs.items():
+        outputs[name], results[name] = run_config_isolated(images, settings)
+    
+    for name, texts in outputs.items():
+        cers, wers = [], []
+        for n, text in enumerate(texts):
+            reference = references[n] if references[n] is not None else outputs["max"][n]
+            cers.append(char_error_rate(text, reference))
+            wers.append(word_error_rate(text, reference))
+        results[name]["cer"] = sum(cers) / len(cers)
+        results[name]["wer"] = sum(wers) / len(wers)
+        results[name]["reference"] = ("ground truth" if all(r is not None for r in references)
+                                      else "ground truth / max profile")
+    return results
+
+
+def print_report(results, previous=None):
+    print(f"{'config':<10} {'img/s':>8} {'CPU s/img':>10} {'p95 ms':>8} {'peak MB':>8} "
+          f"{'CER':>7} {'WER':>7}")
+    for name, r in results.items():
+        p95 = r["steps"].get("total", {}).get("p95_ms", math.nan)
+        peak = (r["peak_rss_bytes"] or 0) / (1024 * 1024)
+        print(f"{name:<10} {r['images_per_sec']:>8.2f} {r['cpu_s_per_image']:>10.3f} {p95:>8.1f} "
+              f"{peak:>8.0f} {r['cer']:>7.3f} {r['wer']:>7.3f}")
+        if previous and name in previous:
+            old = previous[name]
+            speed = 100.0 * (r["images_per_sec"] / old["images_per_sec"] - 1) if old["images_per_sec"] else 0.0
+            print(f"{'  vs prev':<10} {speed:>+7.1f}% {'':>10} {'':>8} {'':>8} "
+                  f"{r['cer'] - old['cer']:>+7.3f} {r['wer'] - old['wer']:>+7.3f}")
+
+
+def save_results(save_dir, results, meta):
+    """Write results to a timestamped file and to last.json for the next --compare"""
+    os.makedirs(save_dir, exist_ok=True)
+    payload = {"meta": meta, "results": results}
+    path = os.path.join(save_dir, time.strftime("bench_%Y%m%d_%H%M%S.json"))
+    for target in (path, os.path.join(save_dir, "last.json")):
+        with open(target, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, indent=2)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark OCR throughput and accuracy.")
+    parser.add_argument("inputs", nargs="*", help="image files, directories or glob patterns")
+    parser.add_argument("-l", "--lang", default="eng")
+    parser.add_argument("--synthetic", type=int, metavar="N",
+                        help="render N synthetic images with ground truth and benchmark those")
+    parser.add_argument("--corpus-dir", help="where to write the synthetic corpus (default: temp dir)")
+    parser.add_argument("--seed", type=int, default=0, help="synthetic corpus seed")
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--json", help="write this run's results to this file")
+    parser.add_argument("--save-dir", help="keep a timestamped copy of the results here (+ last.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    args = parser.parse_args(argv)
+    
+    images = collect_inputs(args.inputs) if args.inputs else []
+    if args.synthetic:
+        corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="ocr_synth_")
+        images += render_corpus(corpus_dir, args.synthetic, args.seed)
+        print(f"Synthetic corpus: {args.synthetic} image(s) in {corpus_dir}")
+    if not images:
+        print("No images found (pass inputs or --synthetic N).", file=sys.stderr)
+        return 1
+    
+    results = benchmark(images, args.configs, args.lang)
+    
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f).get("results")
+    print_report(results, previous)
+    
+    meta = {"images": len(images), "lang": args.lang, "synthetic": args.synthetic,
+            "seed": args.seed, "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    if args.save_dir:
+        print(f"Saved results to {save_results(args.save_dir, results, meta)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
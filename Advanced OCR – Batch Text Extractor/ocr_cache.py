@@ -0,0 +1,157 @@
+"""
+ocr_cache.py
+Content-addressed on-disk cache for OCR results.
+
+Entries are keyed on the SHA-256 of the image bytes plus the effective
+Tesseract config and preprocessing toggle, so renamed or re-submitted scans
+hit the cache while a language or setting change misses it. The cache is
+bounded in size and evicts least-recently-used entries (by file mtime, which
+is bumped on every hit).
+"""
+
+import hashlib
+import os
+import tempfile
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Eviction trims the cache to this fraction of max_bytes, so the directory walk it
+# needs runs once per tenth of the budget written rather than on every put
+LOW_WATER = 0.9
+
+
+def _file_mode():
+    """Mode open() gives new files under this process's umask (read once, at import)"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# mkstemp creates files as 0600; atomic writes chmod to this before renaming into place
+FILE_MODE = _file_mode()
+
+
+def default_cache_dir():
+    """Per-user cache directory (honours XDG_CACHE_HOME)"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "advanced_ocr")
+
+
+def file_digest(image_path, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of a file's contents"""
+    h = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class OCRCache:
+    """Size-bounded LRU cache of extracted text, stored one file per entry"""
+    
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Multi-page documents ask for one key per page; hash each file only once
+        self._digests = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.size = sum(size for _, _, size in self._entries())
+    
+    def key(self, image_path, config, preprocess):
+        """Cache key for an image under a given config / preprocessing toggle"""
+        st = os.stat(image_path)
+        memo_key = (os.path.abspath(image_path), st.st_size, st.st_mtime_ns)
+        digest = self._digests.get(memo_key)
+        if digest is None:
+            digest = self._digests[memo_key] = file_digest(image_path)
+        
+        h = hashlib.sha256()
+        h.update(digest.encode())
+        h.update(b'\0' + config.encode())
+        h.update(b'\0' + (b'1' if preprocess else b'0'))
+        return h.hexdigest()
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".txt")
+    
+    def _entries(self):
+        """(mtime, path, size) for every cached entry"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, path, st.st_size))
+        return entries
+    
+    def get(self, key):
+        """Cached text for key, or None. Counts a hit or a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        
+        # Mark as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return text
+    
+    def put(self, key, text):
+        """Store text for key, evicting old entries if the cache is over budget"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = text.encode('utf-8')
+        
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        
+        # Write atomically so a crash never leaves a truncated entry behind
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, path)
+        
+        self.size += len(data) - old_size
+        if self.size > self.max_bytes:
+            self.evict()
+    
+    def evict(self):
+        """Delete least-recently-used entries until the cache is down to its low-water mark"""
+        entries = sorted(self._entries())
+        self.size = sum(size for _, _, size in entries)
+        target = int(self.max_bytes * LOW_WATER)
+        for _, path, size in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+    
+    def clear(self):
+        for _, path, _ in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.size = 0
+    
+    def stats(self):
+        """Short hit/miss summary for status lines"""
+        return f"Cache: {self.hits} hit(s), {self.misses} miss(es)"
@@ -0,0 +1,134 @@
+"""
+ocr_checkpoint.py
+Checkpoint journal and cooperative cancellation for long batches.
+
+Every finished work unit (an image, or one page of a document) is appended
+to a JSON Lines journal with the output it went to, the size and mtime its
+source had, and the run's config (output format and OCR settings). A
+restarted batch skips the units the journal has marked done, unless their
+source has changed since or they were done with a different config; units
+the journal doesn't know about fall back to what the writer already holds,
+so outputs from before the journal existed are still honoured.
+
+Cancelling is cooperative: a stop request lets the units in progress finish
+and be written, drops the ones not yet started, and leaves the journal and
+the output consistent for the next run.
+"""
+
+import json
+import os
+import time
+
+from ocr_output import result_key
+
+CHECKPOINT_NAME = ".ocr_checkpoint.jsonl"
+# The journal is flushed after every record but fsynced at most this often
+FSYNC_INTERVAL = 1.0
+
+
+def file_signature(path):
+    """(size, mtime_ns) of a file; changes whenever the file is rewritten"""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def run_config(fmt, settings):
+    """Journal config of a run: its output format plus everything that affects the text"""
+    return f"{fmt} {settings.cache_config()}"
+
+
+def cancel_pending(futures):
+    """Cancel the futures that haven't started; running ones finish and are still written"""
+    for future in futures:
+        future.cancel()
+
+
+class CheckpointJournal:
+    """Append-only record of finished units: output written, source signature and config.
+    
+    config identifies what a unit was done with (see run_config); only
+    records made with the same config count as done.
+    """
+    
+    def __init__(self, path, fresh=False, config=None):
+        self.path = path
+        self.config = config
+        self.entries = {}           # result_key -> record
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if fresh and os.path.exists(path):
+            os.remove(path)
+        self._scan()
+        self.file = open(path, 'a', encoding='utf-8')
+        self.last_sync = time.monotonic()
+    
+    def _scan(self):
+        """Load the journal; a torn last line from a crash is cut off"""
+        if not os.path.exists(self.path):
+            return
+        good_end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self.entries[result_key(record["path"], record.get("page"))] = record
+                good_end += len(line)
+        if good_end != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_end)
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def is_done(self, path, page=None):
+        """True if the unit finished with this config, its output still exists and its
+        source is unchanged"""
+        record = self.entries.get(result_key(path, page))
+        if not record or not record.get("ok", True) or record.get("config") != self.config:
+            return False
+        if record.get("output") and not os.path.exists(record["output"]):
+            return False
+        try:
+            return file_signature(path) == (record["size"], record["mtime_ns"])
+        except OSError:
+            return False
+    
+    def resume(self, units, writer):
+        """Keys of (index, path, page) units a restarted batch can skip.
+        
+        A unit the journal knows is skipped only if the journal marks it done
+        with this config and the writer still holds its result; the rest are
+        whatever the writer already holds (e.g. output written without a
+        journal).
+        """
+        known = [unit for unit in units if result_key(unit[1], unit[2]) in self.entries]
+        unknown = [unit for unit in units if result_key(unit[1], unit[2]) not in self.entries]
+        done = {result_key(path, page) for _, path, page in known if self.is_done(path, page)}
+        return (done & writer.completed(known)) | writer.completed(unknown)
+    
+    def mark(self, path, page, output=None, ok=True):
+        """Record a finished unit; failed ones (ok=False) are retried by the next run"""
+        try:
+            size, mtime_ns = file_signature(path)
+        except OSError:
+            size = mtime_ns = None
+        record = {"path": os.path.abspath(path), "page": page,
+                  "output": os.path.abspath(output) if output else None,
+                  "size": size, "mtime_ns": mtime_ns, "ok": ok, "config": self.config}
+        self.entries[result_key(path, page)] = record
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        # A crashed process loses nothing flushed; a crashed machine at most FSYNC_INTERVAL
+        now = time.monotonic()
+        if now - self.last_sync >= FSYNC_INTERVAL:
+            os.fsync(self.file.fileno())
+            self.last_sync = now
+    
+    def close(self):
+        if not self.file.closed:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
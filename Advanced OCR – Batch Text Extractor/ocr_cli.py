@@ -0,0 +1,380 @@
+"""
+ocr_cli.py
+Headless command-line entry point for the batch OCR pipeline.
+
+Runs the same preprocessing / Tesseract path as the GUI without importing
+tkinter, so it works under cron, in containers and on servers with no display.
+Ctrl+C (or SIGTERM) stops after the images in progress; re-running the same
+command resumes from the checkpoint journal.
+
+Usage:
+    python ocr_cli.py scans/ "inbox/*.png" --jobs 8 --lang deu -o out/
+"""
+
+import argparse
+import glob
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import ocr_documents
+import ocr_engine
+import ocr_prefetch
+import ocr_words
+from ocr_cache import OCRCache, DEFAULT_MAX_BYTES
+from ocr_checkpoint import CHECKPOINT_NAME, CheckpointJournal, cancel_pending, run_config
+from ocr_metrics import BatchReport, timed
+from ocr_output import FORMATS, make_writer, result_key
+from ocr_pipeline import OCRPipeline
+
+
+def collect_inputs(patterns):
+    """Expand files, directories and glob patterns into an ordered, de-duplicated list"""
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        
+        for path in matches:
+            if not os.path.isfile(path):
+                if path == pattern:
+                    print(f"warning: no such file: {path}", file=sys.stderr)
+                continue
+            if path != pattern and not path.lower().endswith(ocr_engine.INPUT_EXTENSIONS):
+                continue
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+    return paths
+
+
+def group_units(units, settings, batch_size, prefetch=0, jobs=1):
+    """Split work units into groups of image files to OCR as one task each, as
+    lists of (index, path), and units to OCR on their own.
+    
+    Files under SMALL_FILE_BYTES go in groups of batch_size. With prefetch,
+    larger images go in groups of up to 2 * prefetch so the worker can decode
+    ahead, but never so few groups that some of the jobs sit idle. Document
+    pages and images that need tiling are always on their own.
+    """
+    small, large, single = [], [], []
+    for i, path, page in units:
+        kind = None
+        if page is None:
+            try:
+                if os.path.getsize(path) < ocr_engine.SMALL_FILE_BYTES and batch_size >= 2:
+                    kind = small
+                elif prefetch:
+                    kind = large
+                if kind is not None and ocr_engine.needs_tiling(path, settings):
+                    kind = None
+            except OSError:
+                kind = None
+        if kind is None:
+            single.append((i, path, page))
+        else:
+            kind.append((i, path))
+    
+    batch_size = max(1, batch_size)
+    groups = [small[n:n + batch_size] for n in range(0, len(small), batch_size)]
+    if large:
+        size = max(1, min(2 * prefetch, -(-len(large) // max(1, jobs))))
+        groups += [large[n:n + size] for n in range(0, len(large), size)]
+    return groups, single
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Extract text from images with Tesseract OCR (no GUI).",
+        epilog="Workers keep their Tesseract engines loaded between images only when tesserocr "
+               "is installed; otherwise every image starts a tesseract process."
+    )
+    parser.add_argument("inputs", nargs="+",
+                        help="image files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir",
+                        help="write results here (txt: default is next to each image; "
+                             "jsonl/combined: default is the current directory)")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="txt",
+                        help="txt = one file per image, jsonl = results.jsonl, "
+                             "combined = results.txt, words = word boxes as packed NumPy "
+                             "columns (default: %(default)s)")
+    parser.add_argument("--parquet", action="store_true",
+                        help="with --format words, also convert the word boxes to "
+                             "words.parquet at the end (needs pyarrow)")
+    parser.add_argument("--fresh", action="store_true",
+                        help="start over instead of skipping images already in the output")
+    parser.add_argument("--checkpoint",
+                        help=f"journal of finished images (default: {CHECKPOINT_NAME} in the "
+                             "output directory, or the current directory)")
+    parser.add_argument("-j", "--jobs", type=int, default=ocr_engine.default_workers(),
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("-l", "--lang", default="eng",
+                        help="Tesseract language code, e.g. eng, deu, eng+fra")
+    parser.add_argument("--detect-language", action="store_true",
+                        help="treat --lang (e.g. eng+deu+fra) as candidates and read each page "
+                             "with the single model a quick probe detects")
+    parser.add_argument("--no-preprocess", action="store_true",
+                        help="skip OpenCV enhancement and OCR the raw image")
+    parser.add_argument("--profile", choices=ocr_engine.PROFILES, default="auto",
+                        help="preprocessing profile; auto only denoises noisy images "
+                             "(default: %(default)s)")
+    parser.add_argument("--no-normalize", action="store_true",
+                        help="OCR at the captured resolution instead of rescaling so the text "
+                             "is a comfortable size for Tesseract")
+    parser.add_argument("--tile-height", type=int, default=0,
+                        help="OCR images taller than this in strips of about this many rows "
+                             "to cap memory (default: off)")
+    parser.add_argument("--tile-overlap", type=int, default=64,
+                        help="rows of filter context around each strip (default: %(default)s)")
+    parser.add_argument("--layout", action="store_true",
+                        help="find text regions first, OCR only those and skip blank pages")
+    parser.add_argument("--two-pass", action="store_true",
+                        help="read each page cheaply first and fully preprocess only pages "
+                             "(or --layout regions) below --min-confidence")
+    parser.add_argument("--min-confidence", type=float, default=70.0,
+                        help="mean word confidence (0-100) a first pass must reach "
+                             "(default: %(default)s)")
+    parser.add_argument("--region-workers", type=int, default=1,
+                        help="threads recognising one page's regions in parallel (default: %(default)s)")
+    parser.add_argument("--small-batch", type=int, default=16,
+                        help="OCR files under 100 KB in groups of this many per worker task "
+                             "(default: %(default)s; 0 = one task per image)")
+    parser.add_argument("--prefetch", type=int, default=ocr_prefetch.DEFAULT_AHEAD,
+                        help="images each worker decodes ahead of the one it is recognising "
+                             "(default: %(default)s; 0 = decode on demand)")
+    parser.add_argument("--prefetch-mb", type=int,
+                        default=ocr_prefetch.DEFAULT_BUDGET_BYTES // (1024 * 1024),
+                        help="decoded pixels held ahead across all workers (default: %(default)s)")
+    parser.add_argument("--report",
+                        help="write a per-step timing report here (.json summary or .csv per image)")
+    parser.add_argument("--cache-dir",
+                        help="OCR result cache directory (default: ~/.cache/advanced_ocr)")
+    parser.add_argument("--cache-size-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="maximum cache size before LRU eviction (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always re-run OCR, never read or write the cache")
+    
+    stages = parser.add_argument_group("staged pipeline")
+    stages.add_argument("--pipeline", action="store_true",
+                        help="run decode/preprocess/recognize/write as overlapping thread stages "
+                             "connected by bounded queues instead of a process pool")
+    stages.add_argument("--decode-workers", type=int, default=2)
+    stages.add_argument("--preprocess-workers", type=int,
+                        help="default: --jobs")
+    stages.add_argument("--recognize-workers", type=int,
+                        help="default: --jobs")
+    stages.add_argument("--write-workers", type=int, default=1)
+    stages.add_argument("--queue-size", type=int, default=8,
+                        help="max images waiting between two stages (default: %(default)s)")
+    stages.add_argument("--stats-interval", type=float, default=5.0,
+                        help="seconds between per-stage stats log lines (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    
+    if args.parquet and ocr_words.pyarrow is None:
+        print("--parquet needs pyarrow (pip install pyarrow)", file=sys.stderr)
+        return 1
+    
+    images = collect_inputs(args.inputs)
+    if not images:
+        print("No images found.", file=sys.stderr)
+        return 1
+    
+    settings = ocr_engine.OCRSettings(lang=args.lang, preprocess=not args.no_preprocess,
+                                      profile=args.profile, normalize=not args.no_normalize,
+                                      tile_height=args.tile_height,
+                                      tile_overlap=args.tile_overlap, layout=args.layout,
+                                      two_pass=args.two_pass, min_confidence=args.min_confidence,
+                                      region_workers=args.region_workers,
+                                      detect_language=args.detect_language,
+                                      words=args.format == "words")
+    cache = None if args.no_cache or not settings.cacheable() else \
+        OCRCache(args.cache_dir, args.cache_size_mb * 1024 * 1024)
+    failures = 0
+    done = 0
+    
+    # Documents expand to one unit per page; pages are rendered lazily by the workers
+    units = [unit for i, path in enumerate(images) for unit in ocr_documents.expand(i, path)]
+    
+    # Results stream to disk as they finish; anything already done is skipped
+    writer = make_writer(args.format, args.output_dir, fresh=args.fresh, units=units)
+    journal = CheckpointJournal(args.checkpoint or
+                                os.path.join(args.output_dir or ".", CHECKPOINT_NAME),
+                                fresh=args.fresh, config=run_config(args.format, settings))
+    already_done = journal.resume(units, writer)
+    if already_done:
+        print(f"Resuming: {len(already_done)} image(s)/page(s) already in the output")
+        units = [u for u in units if result_key(u[1], u[2]) not in already_done]
+    total = len(units)
+    report = BatchReport()
+    languages = Counter()
+    
+    # First Ctrl+C/SIGTERM: finish what is running and drop the rest; a second Ctrl+C aborts
+    cancelled = threading.Event()
+    running = {"futures": [], "pipeline": None, "groups": None}
+    
+    def stop(*_):
+        if not cancelled.is_set():
+            print("Stopping after the images in progress (Ctrl+C again to abort)...",
+                  file=sys.stderr)
+        cancelled.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        cancel_pending(running["futures"])
+        if running["groups"]:
+            running["groups"].set()
+        if running["pipeline"]:
+            running["pipeline"].cancel()
+    
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, stop)
+    
+    def write_result(image_path, page, text, stats=None):
+        with timed(stats, "write"):
+            out_path = writer.write(image_path, page, text, stats)
+        journal.mark(image_path, page, out_path)
+        report.add(ocr_documents.page_label(image_path, page), stats)
+        line = f"[{done}/{total}] {ocr_documents.page_label(image_path, page)} -> {out_path}"
+        if stats is None:
+            line += " (cached)"
+        elif stats.get("blank"):
+            line += " (blank page, skipped)"
+        elif "bytes_copied" in stats:
+            detail = f"{ocr_engine.format_bytes(stats['bytes_copied'])} copied"
+            if "profile" in stats:
+                detail = f"profile {stats['profile']}, " + detail
+            if stats.get("scale", 1.0) != 1.0:
+                detail = f"scale {stats['scale']:g}, " + detail
+            if "strips" in stats:
+                detail = f"{stats['strips']} strips, " + detail
+            if "regions" in stats:
+                detail = f"{stats['regions']} regions, " + detail
+            if "confidence" in stats:
+                detail = f"confidence {stats['confidence']:g}, pass {stats['passes']}, " + detail
+            if "lang" in stats:
+                detail = f"lang {stats['lang']}, " + detail
+                languages[stats["lang"]] += 1
+            if "words" in stats:
+                detail = f"{sum(len(part) for part in stats['words'])} words, " + detail
+            line += f" ({detail})"
+        print(line)
+    
+    pending = []
+    keys = {}
+    for i, path, page in units:
+        if cancelled.is_set():
+            break
+        key = cache.key(path, settings.cache_config(page), settings.preprocess) if cache else None
+        text = cache.get(key) if cache else None
+        if text is not None:
+            done += 1
+            write_result(path, page, text)
+            continue
+        keys[(i, page)] = key
+        pending.append((i, path, page))
+    
+    # Pipelined mode may call this from several write threads
+    finish_lock = threading.Lock()
+    
+    def finish(i, image_path, text, stats):
+        nonlocal done, failures
+        page = stats.get("page")
+        with finish_lock:
+            done += 1
+            if text.startswith(ocr_engine.ERROR_PREFIX):
+                failures += 1
+                print(f"[{done}/{total}] FAILED {ocr_documents.page_label(image_path, page)}: "
+                      f"{text}", file=sys.stderr)
+                journal.mark(image_path, page, ok=False)
+                return
+            
+            if cache:
+                cache.put(keys[(i, page)], text)
+            write_result(image_path, page, text, stats)
+    
+    if pending and args.pipeline and not cancelled.is_set():
+        pipeline = running["pipeline"] = OCRPipeline(
+            settings,
+            sink=lambda item: finish(item["index"], item["path"], item["text"], item["stats"]),
+            decode_workers=args.decode_workers,
+            preprocess_workers=args.preprocess_workers or args.jobs,
+            recognize_workers=args.recognize_workers or args.jobs,
+            write_workers=args.write_workers,
+            queue_size=args.queue_size,
+            stats_interval=args.stats_interval)
+        pipeline.run(pending)
+        print(f"Stages: {pipeline.format_stats()} [bottleneck: {pipeline.bottleneck()}]")
+    elif pending and not cancelled.is_set():
+        jobs = max(1, min(args.jobs, len(pending)))
+        # Grouped images come back one by one through this queue as they finish, so they are
+        # written (and a stop takes effect) per image rather than per group
+        context = multiprocessing.get_context()
+        streamed = context.SimpleQueue()
+        running["groups"] = context.Event()
+        
+        def drain():
+            for result in iter(streamed.get, None):
+                finish(*result)
+        
+        drainer = threading.Thread(target=drain, name="ocr-results", daemon=True)
+        drainer.start()
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                                 initializer=ocr_engine.init_group_worker,
+                                 initargs=(streamed, running["groups"], *settings.languages())) as pool:
+            prefetch = max(0, args.prefetch)
+            budget = args.prefetch_mb * 1024 * 1024 // jobs
+            groups, single = group_units(pending, settings, args.small_batch, prefetch, jobs)
+            futures = [pool.submit(ocr_engine.ocr_worker, i, path, settings, page)
+                       for i, path, page in single]
+            futures += [pool.submit(ocr_engine.ocr_paths_worker, group, settings, prefetch, budget)
+                        for group in groups]
+            running["futures"] = futures
+            if cancelled.is_set():
+                cancel_pending(futures)
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                result = future.result()
+                for i, image_path, text, stats in result if isinstance(result, list) else [result]:
+                    finish(i, image_path, text, stats)
+        # Every group has returned, so all it streamed is already queued ahead of this
+        streamed.put(None)
+        drainer.join()
+    
+    writer.close()
+    journal.close()
+    if args.parquet and settings.words:
+        print(f"Parquet: {ocr_words.export_parquet(args.output_dir or '.')}")
+    report.finish()
+    print(report.format_summary())
+    if languages:
+        print("Languages: " + ", ".join(f"{lang} {n}" for lang, n in languages.most_common()))
+    if args.report:
+        report.export(args.report)
+    
+    summary = f"Processed {done - failures}/{total} image(s)/page(s)"
+    if cache:
+        summary += f" | {cache.stats()}"
+    print(summary)
+    if cancelled.is_set():
+        print("Stopped early; run the same command again to resume.", file=sys.stderr)
+        return 130
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+ocr_documents.py
+Lazy page access for multi-page inputs (PDF, multi-page TIFF).
+
+Nothing is rasterised up front: the queue only asks for a page count, and
+each worker renders exactly one page when it gets to it, so a 500-page PDF
+is never held in memory as images. Pages are rendered as 8-bit grayscale.
+
+Optional dependency for PDFs:
+    pip install pymupdf
+"""
+
+import os
+import threading
+
+from PIL import Image
+import numpy as np
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+DOCUMENT_EXTENSIONS = (".pdf", ".tif", ".tiff")
+DEFAULT_PDF_DPI = 300
+
+# Most recently opened PDF per thread, so consecutive pages don't re-parse the file
+_local = threading.local()
+
+
+def is_document(path):
+    """True for formats that may hold more than one page"""
+    return path.lower().endswith(DOCUMENT_EXTENSIONS)
+
+
+def _is_pdf(path):
+    return path.lower().endswith(".pdf")
+
+
+def _open_pdf(path):
+    if fitz is None:
+        raise RuntimeError("PDF input requires PyMuPDF (pip install pymupdf)")
+    cached = getattr(_local, "pdf", None)
+    if cached and cached[0] == path:
+        return cached[1]
+    if cached:
+        cached[1].close()
+    doc = fitz.open(path)
+    _local.pdf = (path, doc)
+    return doc
+
+
+def page_count(path):
+    """Number of pages without rendering any of them"""
+    if _is_pdf(path):
+        return _open_pdf(path).page_count
+    with Image.open(path) as img:
+        return getattr(img, "n_frames", 1)
+
+
+def render_page(path, page, dpi=DEFAULT_PDF_DPI):
+    """Render one page (1-based) as a grayscale array; returns (array, dpi)"""
+    if _is_pdf(path):
+        pix = _open_pdf(path)[page - 1].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+        rows = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.stride)
+        return np.ascontiguousarray(rows[:, :pix.width]), dpi
+    
+    with Image.open(path) as img:
+        img.seek(page - 1)
+        frame_dpi = img.info.get("dpi")
+        array = np.asarray(img.convert("L"))
+    if frame_dpi and frame_dpi[0]:
+        return array, int(round(float(frame_dpi[0])))
+    return array, None
+
+
+def expand(index, path):
+    """Work units for one queue entry: [(index, path, page)], page None for plain images.
+    
+    Unreadable documents yield a single page-less unit so the error is reported
+    through the normal OCR path.
+    """
+    if not is_document(path):
+        return [(index, path, None)]
+    try:
+        count = page_count(path)
+    except Exception:
+        return [(index, path, None)]
+    if count <= 1 and not _is_pdf(path):
+        return [(index, path, None)]
+    return [(index, path, page) for page in range(1, count + 1)]
+
+
+def page_label(path, page):
+    """'scan.pdf' or 'scan.pdf [page 3]'"""
+    name = os.path.basename(path)
+    return name if page is None else f"{name} [page {page}]"
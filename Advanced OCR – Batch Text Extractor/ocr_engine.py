@@ -0,0 +1,868 @@
+"""
+ocr_engine.py
+Tk-free OCR pipeline shared by the GUI and its worker processes.
+
+Everything here is a plain module-level function so it can be pickled and
+run inside a ProcessPoolExecutor worker.
+"""
+
+import io
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from PIL import Image
+import cv2
+import numpy as np
+
+import ocr_backend
+import ocr_documents
+import ocr_language
+import ocr_layout
+import ocr_prefetch
+from ocr_backend import DEFAULT_PSM, tesseract_config
+from ocr_metrics import peak_rss_bytes, timed
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tiff", ".tif", ".bmp", ".gif")
+INPUT_EXTENSIONS = IMAGE_EXTENSIONS + (".pdf",)
+ERROR_PREFIX = "Error processing image: "
+
+PROFILES = ("auto", "fast", "balanced", "max")
+
+# Estimated noise sigma (grey levels) above which auto mode escalates
+AUTO_BALANCED_NOISE = 2.5
+AUTO_MAX_NOISE = 6.0
+
+# Segmentation mode of the cheap first pass in two-pass mode (one uniform block)
+FIRST_PASS_PSM = 6
+
+# Median glyph height (pixels) Tesseract reads best at, and the band left untouched
+TARGET_TEXT_HEIGHT = 32
+MIN_TEXT_HEIGHT = 20
+MAX_TEXT_HEIGHT = 48
+MIN_SCALE, MAX_SCALE = 0.25, 2.0
+
+# Text lines in the band read by the language-detection probe
+PROBE_LINES = 12
+
+# Files below this size are OCR'd in groups, one pool task per group
+SMALL_FILE_BYTES = 100 * 1024
+# Images up to this many pixels keep their intermediate buffers between images
+SMALL_IMAGE_PIXELS = 1024 * 1024
+
+MORPH_KERNEL = np.ones((1, 1), np.uint8)
+
+# CLAHE objects and scratch buffers are reused, but never shared between threads
+_scratch = threading.local()
+
+# Set in group workers by init_group_worker: where finished images go, and the stop flag
+_group_results = None
+_group_cancel = None
+
+
+@dataclass(frozen=True)
+class OCRSettings:
+    """Per-batch OCR options, passed as one picklable object to workers"""
+    lang: str = "eng"
+    preprocess: bool = True
+    profile: str = "max"
+    tile_height: int = 0        # 0 = never split; otherwise max strip height in pixels
+    tile_overlap: int = 64
+    pdf_dpi: int = ocr_documents.DEFAULT_PDF_DPI
+    normalize: bool = True      # rescale so text lands at TARGET_TEXT_HEIGHT before filtering
+    layout: bool = False        # crop to text regions first and skip blank pages
+    two_pass: bool = False      # fast pass first; fully preprocess only low-confidence parts
+    min_confidence: float = 70.0
+    region_workers: int = 1     # threads recognising one page's regions in parallel
+    detect_language: bool = False   # lang lists candidates; read each page with one of them
+    words: bool = False         # also record word boxes in stats["words"] (see ocr_words)
+    
+    def languages(self):
+        """Models a worker should keep loaded: each candidate on its own when detecting"""
+        if self.detect_language:
+            return tuple(ocr_language.candidates(self.lang))
+        return (self.lang,)
+    
+    def cacheable(self):
+        """Whether results may be read from and written to the OCR cache.
+        
+        The cache only holds text, so word boxes always need a recognition
+        pass. Every front end asks here rather than checking options itself.
+        """
+        return not self.words
+    
+    def cache_config(self, page=None):
+        """Everything besides the image bytes that affects the output text"""
+        config = tesseract_config(self.lang)
+        if page is not None:
+            config += f" page={page} render_dpi={self.pdf_dpi}"
+        # Two-pass mode's retry preprocesses with the profile even when preprocess is off
+        if self.preprocess or self.two_pass:
+            config += f" profile={self.profile}"
+        if self.normalize:
+            config += f" text_height={TARGET_TEXT_HEIGHT}"
+        if self.tile_height:
+            config += f" tiles={self.tile_height}/{self.tile_overlap}"
+        if self.layout:
+            config += " layout"
+        if self.two_pass:
+            config += f" two_pass={self.min_confidence:g}"
+        if self.detect_language:
+            config += " detect_language"
+        return config
+
+
+def default_workers():
+    """Number of worker processes to use when none is configured"""
+    return os.cpu_count() or 1
+
+
+def decode_image(image_path):
+    """Read an image from disk as a BGR array"""
+    img = cv2.imread(image_path)
+    if img is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    return img
+
+
+def preprocess_image(image_path, profile="max", stats=None):
+    """Advanced preprocessing for better OCR accuracy"""
+    return preprocess_array(decode_image(image_path), profile, stats)
+
+
+def estimate_noise(gray, max_side=512):
+    """Cheap noise sigma estimate from a Laplacian-style filter on a strided downsample.
+    
+    Striding (rather than area-averaging) keeps per-pixel noise intact, and the
+    median of the filter response ignores the sparse strong edges of text.
+    """
+    step = max(1, max(gray.shape[:2]) // max_side)
+    sample = np.ascontiguousarray(gray[::step, ::step])
+    kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], np.float32)
+    response = cv2.filter2D(sample, cv2.CV_32F, kernel)
+    # The kernel's weights square-sum to 36, so its response has sigma = 6 * noise sigma
+    return float(np.median(np.abs(response))) * 1.4826 / 6.0
+
+
+def choose_profile(gray):
+    """Pick the cheapest profile that should still cope with this image's noise"""
+    noise = estimate_noise(gray)
+    if noise >= AUTO_MAX_NOISE:
+        return "max", noise
+    if noise >= AUTO_BALANCED_NOISE:
+        return "balanced", noise
+    return "fast", noise
+
+
+def estimate_text_height(gray, max_side=1600):
+    """Median glyph height in pixels from connected components, or None if too few glyphs.
+    
+    Runs on a median-filtered downsample with a local threshold, so noise
+    specks and uneven phone-photo lighting don't skew the estimate. Touching
+    glyphs merge into word blobs, which still have the height of the text.
+    """
+    factor = min(1.0, max_side / max(gray.shape[:2]))
+    small = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA) if factor < 1 else gray
+    small = cv2.medianBlur(small, 3)
+    ink = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 15)
+    _, _, comp, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    w = comp[1:, cv2.CC_STAT_WIDTH]
+    h = comp[1:, cv2.CC_STAT_HEIGHT]
+    area = comp[1:, cv2.CC_STAT_AREA]
+    # Keep text-shaped components: not specks, rules, photos or whole blocks
+    glyph = ((h >= 3) & (area >= 10) & (h <= small.shape[0] // 5) & (w <= small.shape[1] // 2) &
+             (h <= 5 * w) & (area > 0.1 * w * h))
+    if np.count_nonzero(glyph) < 8:
+        return None
+    return float(np.median(h[glyph])) / factor
+
+
+def normalize_resolution(img, dpi=None, stats=None):
+    """Rescale an image so its text is near TARGET_TEXT_HEIGHT; returns (image, dpi).
+    
+    Images whose text is already within [MIN_TEXT_HEIGHT, MAX_TEXT_HEIGHT]
+    are returned as is. The scale is recorded in stats["scale"], and the dpi
+    passed on to the recognizer is adjusted to match.
+    """
+    with timed(stats, "scale"):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        text_height = estimate_text_height(gray)
+        scale = 1.0
+        if text_height and not MIN_TEXT_HEIGHT <= text_height <= MAX_TEXT_HEIGHT:
+            scale = min(MAX_SCALE, max(MIN_SCALE, TARGET_TEXT_HEIGHT / text_height))
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=interpolation)
+            if dpi:
+                dpi = int(round(dpi * scale))
+    if stats is not None:
+        stats["scale"] = round(scale, 3)
+        if text_height:
+            stats["text_height"] = round(text_height, 1)
+    return img, dpi
+
+
+def preprocess_array(img, profile="max", stats=None, scratch=False):
+    """Enhancement chain on an already decoded BGR image.
+    
+    Profiles: fast (no denoise), balanced (median blur), max (fastNlMeans),
+    auto (chooses one of the others from a noise estimate). With scratch,
+    every intermediate goes into this thread's reusable buffers and only the
+    returned image is newly allocated.
+    """
+    shape = img.shape[:2]
+    
+    def buf(name):
+        return scratch_buffer(name, shape) if scratch else None
+    
+    with timed(stats, "gray"):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=buf("gray")) if img.ndim == 3 else img
+    
+    with timed(stats, "denoise"):
+        if profile == "auto":
+            profile, noise = choose_profile(gray)
+            if stats is not None:
+                stats["noise"] = round(noise, 2)
+        if stats is not None:
+            stats["profile"] = profile
+        
+        if profile == "max":
+            denoised = cv2.fastNlMeansDenoising(gray, buf("denoised"), 10, 7, 21)
+        elif profile == "balanced":
+            denoised = cv2.medianBlur(gray, 3, dst=buf("denoised"))
+        elif profile == "fast":
+            denoised = gray
+        else:
+            raise ValueError(f"Unknown preprocessing profile: {profile}")
+    
+    with timed(stats, "clahe"):
+        contrast = clahe_filter().apply(denoised, dst=buf("contrast"))
+    with timed(stats, "threshold"):
+        thresh = cv2.adaptiveThreshold(contrast, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                                       cv2.THRESH_BINARY, 11, 2, dst=buf("thresh"))
+    with timed(stats, "morph"):
+        morph = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, MORPH_KERNEL)
+    return morph
+
+
+def clahe_filter():
+    """This thread's CLAHE instance (creating one per image costs more than applying it)"""
+    clahe = getattr(_scratch, "clahe", None)
+    if clahe is None:
+        clahe = _scratch.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return clahe
+
+
+def scratch_buffer(name, shape):
+    """A shape-sized uint8 view of this thread's reusable buffer `name`.
+    
+    The buffer only grows, so images of varying size share it.
+    """
+    buffers = getattr(_scratch, "buffers", None)
+    if buffers is None:
+        buffers = _scratch.buffers = {}
+    size = shape[0] * shape[1]
+    flat = buffers.get(name)
+    if flat is None or flat.size < size:
+        flat = buffers[name] = np.empty(size, np.uint8)
+    return flat[:size].reshape(shape)
+
+
+def preprocess_batch(images, profile="max", stats_list=None):
+    """preprocess_array over a list of images; returns the results in input order.
+    
+    Meant for batches of small images (receipts, labels): they share this
+    thread's CLAHE instance, and their intermediate buffers are reused from
+    image to image, so only each result is newly allocated. stats_list, if
+    given, holds one stats dict per image.
+    """
+    results = []
+    for i, img in enumerate(images):
+        stats = stats_list[i] if stats_list is not None else None
+        scratch = img.shape[0] * img.shape[1] <= SMALL_IMAGE_PIXELS
+        results.append(preprocess_array(img, profile, stats, scratch=scratch))
+    return results
+
+
+def image_dpi(image_path):
+    """Resolution in the header of an image path or file object, or None (only the header is read)"""
+    try:
+        with Image.open(image_path) as img:
+            dpi = img.info.get("dpi")
+    except Exception:
+        return None
+    if dpi and dpi[0]:
+        return int(round(float(dpi[0])))
+    return None
+
+
+def load_image(image_path):
+    """Decode an image for OCR without any enhancement (8-bit grayscale or RGB)"""
+    img = cv2.imread(image_path, cv2.IMREAD_ANYCOLOR)
+    if img is None:
+        # Formats OpenCV can't decode (e.g. GIF on older builds)
+        with Image.open(image_path) as pil_img:
+            return np.asarray(pil_img.convert("L" if pil_img.mode in ("1", "L") else "RGB"))
+    return to_rgb(img)
+
+
+def to_rgb(img):
+    """OpenCV BGR (or grayscale) array -> array Tesseract expects"""
+    if img.ndim == 2:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def init_worker(*langs):
+    """Pool initializer: load the language models once per worker process"""
+    # Ctrl+C reaches the whole process group; the parent decides what it cancels
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for lang in langs:
+        try:
+            ocr_backend.get_backend(lang)
+        except Exception:
+            # Surface the failure per image from extract_text instead of breaking the pool
+            pass
+
+
+def init_group_worker(results, cancel, *langs):
+    """Pool initializer for streaming groups: ocr_paths_worker puts each finished image
+    on the results queue at once, and stops before its next image once cancel is set"""
+    global _group_results, _group_cancel
+    _group_results, _group_cancel = results, cancel
+    init_worker(*langs)
+
+
+def strip_bounds(gray, strip_height, overlap):
+    """Split rows into consecutive [top, bottom) strips of roughly strip_height.
+    
+    Each cut is moved to the brightest row within +/- overlap of the nominal
+    boundary, i.e. into the gap between text lines, so no line is split in two;
+    with overlap 0 the cuts stay at the nominal boundaries.
+    """
+    height = gray.shape[0]
+    # Average brightness of every row; cv2.reduce avoids a full-frame temporary
+    row_mean = cv2.reduce(gray, 1, cv2.REDUCE_AVG, dtype=cv2.CV_32F).ravel()
+    # Smooth so the cut lands in the middle of an inter-line gap, not on its edge
+    row_mean = np.convolve(row_mean, np.ones(9, np.float32) / 9, mode='same')
+    
+    top = 0
+    while top < height:
+        nominal = top + strip_height
+        if nominal >= height:
+            yield top, height
+            return
+        lo = max(top + 1, nominal - overlap)
+        hi = min(height, nominal + overlap)
+        # No overlap leaves no window to search: cut at the nominal boundary
+        bottom = lo + int(np.argmax(row_mean[lo:hi])) if hi > lo else nominal
+        yield top, bottom
+        top = bottom
+
+
+def extract_text_tiled(image_path, settings, stats):
+    """OCR a very large image strip by strip to keep memory bounded.
+    
+    The image is decoded once as 8-bit grayscale; every later buffer (denoise,
+    CLAHE, threshold, morph, recognizer input) is strip-sized. Strips are
+    filtered with `tile_overlap` rows of context on each side so the adaptive
+    filters see no artificial border, then cropped back before recognition.
+    """
+    with timed(stats, "decode"):
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    
+    height = gray.shape[0]
+    overlap = settings.tile_overlap
+    profile = settings.profile
+    if settings.preprocess and profile == "auto":
+        profile, noise = choose_profile(gray)
+        stats["noise"] = round(noise, 2)
+    
+    dpi = image_dpi(image_path)
+    settings = language_settings(gray, settings, dpi, stats)
+    texts = []
+    strips = 0
+    found = 0
+    for top, bottom in strip_bounds(gray, settings.tile_height, overlap):
+        ctx_top = max(0, top - overlap)
+        ctx_bottom = min(height, bottom + overlap)
+        strip = gray[ctx_top:ctx_bottom]
+        regions = page_regions(gray[top:bottom], settings, stats)
+        found += len(regions or ())
+        if settings.preprocess and not settings.two_pass and regions != []:
+            strip = preprocess_array(strip, profile, stats)
+        core = strip[top - ctx_top:bottom - ctx_top]
+        
+        text = recognize_page(core, settings, dpi, stats, origin=(0, top), regions=regions)
+        strips += 1
+        if text.strip():
+            texts.append(text.strip())
+    
+    stats["strips"] = strips
+    if settings.layout and not settings.two_pass:
+        # Totals for the image, not the last strip's
+        stats["regions"] = found
+        stats["blank"] = not found
+    return "\n".join(texts) + "\n"
+
+
+def needs_tiling(image_path, settings):
+    """True if tiling is enabled and the image is tall enough to be split"""
+    if not settings.tile_height:
+        return False
+    try:
+        with Image.open(image_path) as img:
+            height = img.size[1]
+    except Exception:
+        return False
+    return height > settings.tile_height + settings.tile_overlap
+
+
+def read_source(image_path, settings, page=None, stats=None):
+    """Decode an image, or render one page of a document; returns (array, dpi).
+    
+    Plain images come back as BGR when preprocessing (RGB otherwise);
+    document pages are always rendered as grayscale.
+    """
+    with timed(stats, "decode"):
+        if page is not None:
+            return ocr_documents.render_page(image_path, page, settings.pdf_dpi)
+        return decode_file(image_path, settings, stats)
+
+
+def decode_file(image_path, settings, stats=None):
+    """Decode an image file from a memory-mapped (or, on network shares, one-read) buffer.
+    
+    Returns (array, dpi) like read_source; the bytes read are recorded in
+    stats["read_bytes"].
+    """
+    data = ocr_prefetch.read_file(image_path)
+    try:
+        if stats is not None:
+            stats["read_bytes"] = len(data)
+        try:
+            return decode_bytes(data, settings)
+        except ValueError:
+            if settings.preprocess:
+                raise ValueError(f"Could not read image: {image_path}")
+            # Formats OpenCV can't decode (e.g. GIF on older builds)
+            return load_image(image_path), image_dpi(image_path)
+    finally:
+        ocr_prefetch.release(data)
+
+
+def probe_band(gray, rows):
+    """The `rows`-tall horizontal band of a page holding the most ink"""
+    if gray.shape[0] <= rows:
+        return gray
+    ink = 255.0 - cv2.reduce(gray, 1, cv2.REDUCE_AVG, dtype=cv2.CV_32F).ravel()
+    window = np.convolve(ink, np.ones(rows, np.float32), mode='valid')
+    top = int(np.argmax(window))
+    return gray[top:top + rows]
+
+
+def detect_language(image, settings, dpi=None, stats=None):
+    """Pick one of the candidate languages in settings.lang for this page.
+    
+    A band of about PROBE_LINES text lines is read from grayscale with the
+    first candidate's model, and the text is scored per language. Returns
+    settings.lang unchanged (the combined model) if the evidence is unclear.
+    """
+    langs = ocr_language.candidates(settings.lang)
+    if len(langs) < 2:
+        return settings.lang
+    with timed(stats, "detect"):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        # Normalised text is TARGET_TEXT_HEIGHT tall; lines are spaced about twice that
+        band = probe_band(gray, PROBE_LINES * 2 * TARGET_TEXT_HEIGHT)
+        text, copied = ocr_backend.get_backend(langs[0]).recognize_raw(band, FIRST_PASS_PSM, dpi)
+        lang = ocr_language.guess_language(text, langs) or settings.lang
+    if stats is not None:
+        stats["bytes_copied"] = stats.get("bytes_copied", 0) + copied
+        stats["lang"] = lang
+    return lang
+
+
+def language_settings(image, settings, dpi=None, stats=None):
+    """settings for recognising this page: with detection on, narrowed to the detected language"""
+    if not settings.detect_language:
+        return settings
+    return replace(settings, lang=detect_language(image, settings, dpi, stats), detect_language=False)
+
+
+def recognize(image, settings, dpi=None, stats=None, psm=DEFAULT_PSM, origin=(0, 0)):
+    """Run this thread's recognizer on a pixel buffer, recording time and bytes copied.
+    
+    With settings.words the word boxes go to stats too, moved by origin (the
+    buffer's position in the page) into page coordinates.
+    """
+    if settings.words:
+        text, _, words = recognize_confidence(image, settings, dpi, stats, psm)
+        add_words(stats, words, origin)
+        return text
+    with timed(stats, "recognize"):
+        text, copied = ocr_backend.get_backend(settings.lang).recognize_raw(image, psm, dpi)
+    if stats is not None:
+        stats["bytes_copied"] = stats.get("bytes_copied", 0) + copied
+    return text
+
+
+def recognize_confidence(image, settings, dpi=None, stats=None, psm=DEFAULT_PSM):
+    """Like recognize(), but returns (text, per-word confidences, WordBoxes or None).
+    
+    The word boxes come back (unrecorded) only with settings.words.
+    """
+    backend = ocr_backend.get_backend(settings.lang)
+    words = None
+    with timed(stats, "recognize"):
+        if settings.words:
+            text, words, copied = backend.recognize_words(image, psm, dpi)
+            confs = words.conf.tolist()
+        else:
+            text, confs, copied = backend.recognize_data(image, psm, dpi)
+    if stats is not None:
+        stats["bytes_copied"] = stats.get("bytes_copied", 0) + copied
+    return text, confs, words
+
+
+def add_words(stats, words, origin=(0, 0)):
+    """Append one part of a page's word boxes to stats["words"], in page coordinates"""
+    if stats is not None and words is not None:
+        stats.setdefault("words", []).append(words.shifted(*origin))
+
+
+def mean_confidence(confs):
+    """Mean word confidence (0-100); 0 when nothing was recognised"""
+    return sum(confs) / len(confs) if confs else 0.0
+
+
+_region_pool = None
+_region_pool_size = 0
+_region_pool_lock = threading.Lock()
+
+
+def region_pool(workers):
+    """Per-process thread pool for recognising regions; each thread keeps its own backend"""
+    global _region_pool, _region_pool_size
+    with _region_pool_lock:
+        if _region_pool is None or _region_pool_size < workers:
+            _region_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-region")
+            _region_pool_size = workers
+        return _region_pool
+
+
+def map_regions(func, regions, settings, stats=None):
+    """Run func(region, region_stats) for every region, in parallel if configured.
+    
+    Every region records into its own dict so threads never share one; those
+    are folded into stats afterwards. Returns the results in region order.
+    """
+    def run(region):
+        region_stats = {}
+        return func(region, region_stats), region_stats
+    
+    if settings.region_workers > 1 and len(regions) > 1:
+        results = list(region_pool(settings.region_workers).map(run, regions))
+    else:
+        results = [run(region) for region in regions]
+    
+    if stats is not None:
+        timings = stats.setdefault("timings", {})
+        for _, region_stats in results:
+            for step, seconds in region_stats.pop("timings", {}).items():
+                timings[step] = timings.get(step, 0.0) + seconds
+            stats["bytes_copied"] = stats.get("bytes_copied", 0) + region_stats.pop("bytes_copied", 0)
+            if "words" in region_stats:
+                stats.setdefault("words", []).extend(region_stats.pop("words"))
+            for key, value in region_stats.items():
+                stats.setdefault(key, value)
+    return [result for result, _ in results]
+
+
+def find_text_regions(image, stats=None):
+    """Timed layout pre-pass; records the region count and whether the page is blank"""
+    with timed(stats, "layout"):
+        regions = ocr_layout.find_regions(image)
+    if stats is not None:
+        stats["regions"] = len(regions)
+        stats["blank"] = not regions
+    return regions
+
+
+def page_regions(image, settings, stats=None):
+    """Layout pre-pass on a page before it is preprocessed; None if not enabled.
+    
+    It has to see the unprocessed page: adaptive thresholding turns the noise
+    of blank paper into speckle that looks like ink (and can bury faint text).
+    A blank page ([]) needs no preprocessing. Two-pass mode runs its own.
+    """
+    if settings.layout and not settings.two_pass:
+        return find_text_regions(image, stats)
+    return None
+
+
+def join_regions(texts):
+    texts = [text.strip() for text in texts if text.strip()]
+    return "\n\n".join(texts) + "\n" if texts else ""
+
+
+def recognize_regions(image, settings, dpi=None, stats=None, origin=(0, 0), regions=None):
+    """Layout pre-pass, then recognise only the text regions (in reading order).
+    
+    regions, if given, come from page_regions on the unprocessed page. Blank
+    pages skip recognition entirely and come back as an empty string.
+    """
+    def run(region, region_stats):
+        x, y, w, h, psm = region
+        return recognize(image[y:y + h, x:x + w], settings, dpi, region_stats, psm,
+                         (origin[0] + x, origin[1] + y))
+    
+    if regions is None:
+        regions = find_text_regions(image, stats)
+    return join_regions(map_regions(run, regions, settings, stats))
+
+
+def recognize_two_pass(image, settings, dpi=None, stats=None, origin=(0, 0)):
+    """Confidence-driven recognition of an unprocessed image.
+    
+    The first pass reads plain grayscale with a fast segmentation mode. Only
+    the page (or, with the layout pre-pass, the regions) whose mean word
+    confidence is below settings.min_confidence get the full preprocessing
+    chain and a second pass; whichever pass scored higher is kept.
+    """
+    with timed(stats, "gray"):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    if settings.layout:
+        regions = find_text_regions(gray, stats)
+    else:
+        regions = [(0, 0, gray.shape[1], gray.shape[0], None)]
+    
+    def run(region, region_stats):
+        x, y, w, h, psm = region
+        position = (origin[0] + x, origin[1] + y)
+        text, confs, words = recognize_confidence(gray[y:y + h, x:x + w], settings, dpi,
+                                                  region_stats, psm or FIRST_PASS_PSM)
+        first = mean_confidence(confs)
+        if first >= settings.min_confidence:
+            add_words(region_stats, words, position)
+            return text, confs, False
+        enhanced = preprocess_array(image[y:y + h, x:x + w], settings.profile, region_stats)
+        text2, confs2, words2 = recognize_confidence(enhanced, settings, dpi, region_stats,
+                                                     psm or DEFAULT_PSM)
+        # Only the words of the pass that is kept are recorded
+        if mean_confidence(confs2) >= first:
+            add_words(region_stats, words2, position)
+            return text2, confs2, True
+        add_words(region_stats, words, position)
+        return text, confs, True
+    
+    results = map_regions(run, regions, settings, stats)
+    if stats is not None:
+        stats["confidence"] = round(mean_confidence([c for _, confs, _ in results for c in confs]), 1)
+        stats["reprocessed"] = sum(1 for *_, again in results if again)
+        stats["passes"] = 2 if stats["reprocessed"] else 1
+    if not settings.layout:
+        return results[0][0]
+    return join_regions(text for text, _, _ in results)
+
+
+def recognize_page(image, settings, dpi=None, stats=None, origin=(0, 0), regions=None):
+    """Recognise a page, via the two-pass mode or the layout pre-pass if enabled.
+    
+    The image is preprocessed already, except in two-pass mode, which decides
+    per page or region whether to preprocess at all. origin is where the
+    image sits in the page (a strip of a tiled scan), for word boxes; regions
+    are the page_regions found before preprocessing.
+    """
+    if settings.two_pass:
+        return recognize_two_pass(image, settings, dpi, stats, origin)
+    if settings.layout:
+        return recognize_regions(image, settings, dpi, stats, origin, regions)
+    return recognize(image, settings, dpi, stats, origin=origin)
+
+
+def extract_text_stats(image_path, settings, page=None):
+    """Extract text from an image or one page of a document; returns (text, stats)"""
+    stats = {}
+    if page is not None:
+        stats["page"] = page
+    try:
+        with timed(stats, "total"):
+            if page is None and needs_tiling(image_path, settings):
+                return extract_text_tiled(image_path, settings, stats), stats
+            
+            image, dpi = read_source(image_path, settings, page, stats)
+            return ocr_array(image, settings, dpi, stats), stats
+    
+    except Exception as e:
+        return f"{ERROR_PREFIX}{str(e)}", stats
+
+
+def ocr_array(image, settings, dpi=None, stats=None):
+    """Scale, enhance and recognise an already decoded image"""
+    if settings.normalize:
+        image, dpi = normalize_resolution(image, dpi, stats)
+    settings = language_settings(image, settings, dpi, stats)
+    regions = page_regions(image, settings, stats)
+    if settings.preprocess and not settings.two_pass and regions != []:
+        image = preprocess_array(image, settings.profile, stats)
+    return recognize_page(image, settings, dpi, stats, regions=regions)
+
+
+def decode_bytes(data, settings):
+    """Decode an encoded image held in memory; returns (array, dpi) like read_source"""
+    img = cv2.imdecode(np.frombuffer(data, np.uint8),
+                       cv2.IMREAD_COLOR if settings.preprocess else cv2.IMREAD_ANYCOLOR)
+    if img is None:
+        raise ValueError("Could not decode image data")
+    if not settings.preprocess:
+        img = to_rgb(img)
+    # An mmap is already a file object; PIL only reads its header
+    return img, image_dpi(io.BytesIO(data) if isinstance(data, bytes) else data)
+
+
+def extract_text_bytes(data, settings):
+    """Extract text from an encoded image held in memory; returns (text, stats)"""
+    stats = {}
+    try:
+        with timed(stats, "total"):
+            with timed(stats, "decode"):
+                image, dpi = decode_bytes(data, settings)
+            return ocr_array(image, settings, dpi, stats), stats
+    
+    except Exception as e:
+        return f"{ERROR_PREFIX}{str(e)}", stats
+
+
+def ocr_arrays(items, settings):
+    """ocr_array over a batch of decoded images, enhancing them together with preprocess_batch.
+    
+    items are dicts with image, dpi and stats keys; each gets item["text"],
+    an error text if that image failed, so one bad image never fails the
+    batch. Items that already have a text (e.g. failed to decode) are skipped.
+    """
+    def attempt(item, step):
+        if "text" in item:
+            return
+        try:
+            step(item)
+        except Exception as e:
+            item["text"] = f"{ERROR_PREFIX}{str(e)}"
+            item.pop("image", None)
+    
+    def prepare(item):
+        if settings.normalize:
+            item["image"], item["dpi"] = normalize_resolution(item["image"], item["dpi"],
+                                                              item["stats"])
+        item["settings"] = language_settings(item["image"], settings, item["dpi"], item["stats"])
+        item["regions"] = page_regions(item["image"], settings, item["stats"])
+    
+    def enhance(batch):
+        images = preprocess_batch([item["image"] for item in batch], settings.profile,
+                                  [item["stats"] for item in batch])
+        for item, image in zip(batch, images):
+            item["image"] = image
+    
+    def read(item):
+        item["text"] = recognize_page(item.pop("image"), item.pop("settings"), item["dpi"],
+                                      item["stats"], regions=item.pop("regions"))
+    
+    for item in items:
+        attempt(item, prepare)
+    if settings.preprocess and not settings.two_pass:
+        batch = [item for item in items if "text" not in item and item["regions"] != []]
+        try:
+            enhance(batch)
+        except Exception as e:
+            for item in batch:
+                item["text"] = f"{ERROR_PREFIX}{str(e)}"
+    for item in items:
+        attempt(item, read)
+    
+    # Worker-side time for each image is the sum of its own step times
+    for item in items:
+        timings = item["stats"].get("timings")
+        if timings:
+            timings["total"] = sum(timings.values())
+        item["stats"]["peak_rss"] = peak_rss_bytes()
+    return items
+
+
+def _decoded(stats, decode):
+    """Batch item for ocr_arrays from decode() -> (image, dpi), or a failed one"""
+    item = {"stats": stats}
+    try:
+        with timed(stats, "decode"):
+            item["image"], item["dpi"] = decode()
+    except Exception as e:
+        item["text"] = f"{ERROR_PREFIX}{str(e)}"
+    return item
+
+
+def ocr_batch_worker(batch, settings):
+    """Pool entry point: OCR a micro-batch of in-memory images as one task; returns [(text, stats)]"""
+    items = [_decoded({}, lambda data=data: decode_bytes(data, settings)) for data in batch]
+    return [(item["text"], item["stats"]) for item in ocr_arrays(items, settings)]
+
+
+def ocr_paths_worker(units, settings, prefetch=0, budget_bytes=ocr_prefetch.DEFAULT_BUDGET_BYTES):
+    """Pool entry point: OCR a group of image files as one task.
+    
+    units are (index, path) pairs; returns [(index, path, text, stats)] like
+    ocr_worker does for one image. Grouping saves a task round trip per image
+    and lets the group share scratch buffers. In a pool started with
+    init_group_worker, each result is put on its queue as soon as the image
+    is done instead (so nothing waits for the rest of the group) and []
+    is returned; once its cancel event is set the group stops before the
+    next image, leaving the rest for a resumed run. With prefetch > 0 the next
+    `prefetch` images (at most budget_bytes of pixels) are decoded on
+    background threads while the current one is recognised; the time spent
+    waiting for a decode is then stats["timings"]["stall"].
+    """
+    def load(unit):
+        stats = {}
+        item = _decoded(stats, lambda: decode_file(unit[1], settings, stats))
+        return item, item["image"].nbytes if "image" in item else 0
+    
+    results = []
+    for (index, path), item, error, stall in ocr_prefetch.Prefetcher(units, load, prefetch,
+                                                                      budget_bytes):
+        if _group_cancel is not None and _group_cancel.is_set():
+            break
+        if error is not None:
+            item = {"stats": {}, "text": f"{ERROR_PREFIX}{str(error)}"}
+        ocr_arrays([item], settings)
+        if prefetch:
+            # The decode overlapped with the previous image; this one only waited `stall` for it
+            timings = item["stats"].setdefault("timings", {})
+            timings["stall"] = stall
+            timings["total"] = timings.get("total", 0.0) - timings.get("decode", 0.0) + stall
+        result = (index, path, item["text"], item["stats"])
+        if _group_results is not None:
+            _group_results.put(result)
+        else:
+            results.append(result)
+    return results
+
+
+def extract_text(image_path, lang="eng", preprocess=True, profile="max"):
+    """Extract text from image"""
+    return extract_text_stats(image_path, OCRSettings(lang, preprocess, profile))[0]
+
+
+def ocr_worker(index, image_path, settings, page=None):
+    """Pool entry point: OCR one queued image (or document page) and tag it with its
+    queue position; the page number, if any, is in stats["page"]"""
+    text, stats = extract_text_stats(image_path, settings, page)
+    stats["peak_rss"] = peak_rss_bytes()
+    return index, image_path, text, stats
+
+
+def format_bytes(n):
+    """Human-readable byte count"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
@@ -0,0 +1,84 @@
+"""
+ocr_language.py
+Guess a page's language from the text of a quick probe pass.
+
+Mixed-language batches would otherwise need a combined model such as
+eng+deu+fra on every page, which makes Tesseract run every model over
+every line. Instead a band of the page is read with a single model and
+the result is scored against the most frequent function words and the
+accented letters of each candidate language; the page is then recognised
+with the winner's model alone.
+
+The probe model only has to get short common words right, which any
+Latin-script model does for any Latin-script language. Languages without
+hints below (e.g. chi_sim, ara) are never picked by detection; pages with
+no clear winner keep the combined model.
+"""
+
+import re
+
+# Common function words; an OCR'd band of a dozen lines contains several
+STOPWORDS = {
+    "eng": {"the", "and", "of", "to", "is", "that", "with", "for", "this", "are", "was",
+            "from", "which", "have", "not", "be", "by", "on", "at", "it", "or", "you"},
+    "deu": {"der", "die", "das", "und", "ist", "nicht", "mit", "den", "dem", "des", "ein",
+            "eine", "einer", "auf", "sich", "auch", "zu", "von", "für", "fur", "wird", "sind",
+            "werden", "oder", "bei", "nach", "wie", "im", "aus"},
+    "fra": {"le", "la", "les", "et", "des", "est", "une", "un", "du", "que", "qui", "dans",
+            "pour", "pas", "sur", "au", "aux", "avec", "ce", "cette", "sont", "par", "il",
+            "elle", "nous", "vous", "ne", "se", "ou"},
+    "spa": {"el", "los", "las", "del", "que", "y", "es", "una", "por", "con", "para",
+            "como", "pero", "su", "sus", "al", "lo", "se", "está", "esta", "son", "muy"},
+    "ita": {"il", "gli", "che", "di", "della", "delle", "del", "per", "una", "sono", "con",
+            "non", "come", "anche", "nel", "nella", "alla", "questo", "questa", "è"},
+    "por": {"o", "os", "as", "que", "do", "da", "dos", "das", "não", "nao", "uma", "com",
+            "para", "por", "em", "no", "na", "mais", "como", "ser", "são", "foi"},
+    "nld": {"de", "het", "een", "en", "van", "is", "niet", "dat", "op", "te", "zijn",
+            "met", "voor", "ook", "maar", "wordt", "worden", "bij", "aan", "deze", "naar"},
+}
+
+# Letters (almost) unique to one language; a probe with another model may drop them
+MARKS = {
+    "deu": "äöüß",
+    "fra": "éèêàçœùâîô",
+    "spa": "ñ¿¡á",
+    "ita": "ìò",
+    "por": "ãõ",
+}
+
+# A language needs at least this many hits, and a clear lead, to be chosen
+MIN_EVIDENCE = 3
+MIN_LEAD = 1.5
+
+_WORD = re.compile(r"[^\W\d_]+")
+
+
+def candidates(lang):
+    """Individual models of a Tesseract language string, e.g. 'eng+deu' -> ['eng', 'deu']"""
+    return [code for code in lang.split("+") if code]
+
+
+def language_scores(text, langs):
+    """Evidence for each candidate language in text: stop-word hits plus marked letters"""
+    lowered = text.lower()
+    words = _WORD.findall(lowered)
+    scores = {}
+    for lang in langs:
+        stopwords = STOPWORDS.get(lang, ())
+        score = sum(1 for word in words if word in stopwords)
+        score += sum(lowered.count(mark) for mark in MARKS.get(lang, ""))
+        scores[lang] = score
+    return scores
+
+
+def guess_language(text, langs):
+    """Best-supported language of text among langs, or None if the evidence is unclear"""
+    scores = language_scores(text, langs)
+    if not scores:
+        return None
+    ranked = sorted(scores.values(), reverse=True)
+    best = max(scores, key=scores.get)
+    runner_up = ranked[1] if len(ranked) > 1 else 0
+    if ranked[0] < MIN_EVIDENCE or ranked[0] < MIN_LEAD * runner_up:
+        return None
+    return best
@@ -0,0 +1,99 @@
+"""
+ocr_layout.py
+Fast layout pre-pass run before recognition.
+
+Finds the text regions of a page from connected components of its ink on a
+downsampled copy, so Tesseract is only fed the regions that hold text
+instead of the whole frame. Each region gets a page segmentation mode that
+suits its shape, and pages without any text are reported as blank so they
+can be skipped outright.
+"""
+
+import cv2
+import numpy as np
+
+from ocr_backend import DEFAULT_PSM
+
+# Tesseract page segmentation modes used for cropped regions
+PSM_BLOCK = 6   # a single uniform block of text
+PSM_LINE = 7    # a single text line
+PSM_WORD = 8    # a single word
+
+# Layout analysis runs on a copy no larger than this (pixels, longest side)
+ANALYSIS_MAX_SIDE = 1024
+# Minimum grey-level gap between ink and paper for a page to count as having text
+MIN_CONTRAST = 60
+# Components smaller than this (analysis pixels) are specks, not glyphs
+MIN_COMPONENT_AREA = 6
+# Above this fraction of the page, cropping saves little: recognise the whole frame
+FULL_PAGE_COVERAGE = 0.6
+# More regions than this cost more in per-call overhead than they save
+MAX_REGIONS = 16
+# Padding around each region in full-resolution pixels
+REGION_PADDING = 8
+
+
+def _gray(image):
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY if image.shape[2] == 3 else cv2.COLOR_RGBA2GRAY)
+
+
+def choose_psm(width, height, text_height):
+    """Segmentation mode for a region from its size relative to the text height"""
+    if height < 2 * text_height:
+        return PSM_WORD if width < 4 * text_height else PSM_LINE
+    return PSM_BLOCK
+
+
+def find_regions(image, max_side=ANALYSIS_MAX_SIDE):
+    """Text regions of a page as (x, y, w, h, psm) in reading order; [] if the page is blank.
+    
+    Works on dark text on a light background. Give it the page before adaptive
+    thresholding: that turns paper noise into speckle, and a noisy blank page
+    would then look like a page full of text.
+    If the text covers most of the page a single full-frame region with
+    Tesseract's automatic segmentation is returned.
+    """
+    gray = _gray(image)
+    height, width = gray.shape
+    scale = min(1.0, max_side / max(height, width))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    
+    _, ink = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    # Otsu always splits the histogram somewhere; on a blank (if noisy) page the
+    # two classes are barely apart, while ink and paper are far apart
+    ink_mean = cv2.mean(small, mask=ink)[0]
+    paper_mean = cv2.mean(small, mask=cv2.bitwise_not(ink))[0]
+    if not cv2.countNonZero(ink) or paper_mean - ink_mean < MIN_CONTRAST:
+        return []
+    
+    _, labels, comp, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    keep = comp[:, cv2.CC_STAT_AREA] >= MIN_COMPONENT_AREA
+    keep[0] = False
+    if not keep.any():
+        return []
+    glyphs = np.where(keep[labels], 255, 0).astype(np.uint8)
+    
+    # Smear glyphs into words and lines, and neighbouring lines into blocks
+    text_height = max(2, int(np.median(comp[keep, cv2.CC_STAT_HEIGHT])))
+    reach = 2 * text_height
+    blocks = cv2.dilate(glyphs, cv2.getStructuringElement(cv2.MORPH_RECT, (reach, reach)))
+    _, _, boxes, _ = cv2.connectedComponentsWithStats(blocks, connectivity=8)
+    
+    boxes = boxes[1:, :4]
+    if (len(boxes) > MAX_REGIONS or
+            boxes[:, 2].astype(np.int64) @ boxes[:, 3] >= FULL_PAGE_COVERAGE * small.size):
+        return [(0, 0, width, height, DEFAULT_PSM)]
+    
+    regions = []
+    pad = REGION_PADDING
+    for x, y, w, h in sorted(boxes.tolist(), key=lambda b: (b[1], b[0])):
+        # Judge the shape by the ink, not the dilated box around it
+        psm = choose_psm(w - reach, h - reach, text_height)
+        x0 = max(0, int(x / scale) - pad)
+        y0 = max(0, int(y / scale) - pad)
+        x1 = min(width, int((x + w) / scale) + pad)
+        y1 = min(height, int((y + h) / scale) + pad)
+        regions.append((x0, y0, x1 - x0, y1 - y0, psm))
+    return regions
@@ -0,0 +1,160 @@
+"""
+ocr_metrics.py
+Hot-path timing instrumentation and batch performance reports.
+
+Engine functions record per-step wall times into a stats dict via timed();
+BatchReport collects those per image and summarises a batch as
+p50/p95/p99 latencies per step, images per second, file read throughput
+and peak memory, with JSON and CSV export.
+
+Per-image timings are kept in flat float arrays (one per step) rather than
+dicts, so a 100k-image report stays a few MB.
+"""
+
+import csv
+import json
+import math
+import os
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Steps in pipeline order; "total" is the worker's wall time for the whole image, and
+# "stall" the part of it spent waiting for a prefetched decode (see ocr_prefetch)
+STEPS = ("decode", "stall", "scale", "detect", "gray", "denoise", "clahe", "threshold", "morph",
+         "layout", "recognize", "write", "total")
+
+
+@contextmanager
+def timed(stats, step):
+    """Add the wall time of the with-block to stats["timings"][step] (no-op if stats is None)"""
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = stats.setdefault("timings", {})
+        timings[step] = timings.get(step, 0.0) + time.perf_counter() - start
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, or None where unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class BatchReport:
+    """Thread-safe collector of per-image timings for one batch"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.labels = []
+        self.columns = {step: array('d') for step in STEPS}
+        self.worker_peak_rss = 0
+        self.read_bytes = 0
+        self.read_seconds = 0.0     # decode time of the images counted in read_bytes
+        self.started = time.perf_counter()
+        self.finished = None
+    
+    def add(self, label, stats):
+        """Record one image; missing steps are stored as NaN"""
+        timings = (stats or {}).get("timings", {})
+        with self.lock:
+            self.labels.append(label)
+            for step in STEPS:
+                self.columns[step].append(timings.get(step, math.nan))
+            if (stats or {}).get("read_bytes"):
+                self.read_bytes += stats["read_bytes"]
+                self.read_seconds += timings.get("decode", 0.0)
+            rss = (stats or {}).get("peak_rss")
+            if rss and rss > self.worker_peak_rss:
+                self.worker_peak_rss = rss
+    
+    def finish(self):
+        self.finished = time.perf_counter()
+    
+    def summary(self):
+        with self.lock:
+            count = len(self.labels)
+            elapsed = (self.finished or time.perf_counter()) - self.started
+            steps = {}
+            for step in STEPS:
+                values = sorted(v for v in self.columns[step] if not math.isnan(v))
+                if not values:
+                    continue
+                steps[step] = {
+                    "count": len(values),
+                    "mean_ms": 1000 * sum(values) / len(values),
+                    "p50_ms": 1000 * percentile(values, 50),
+                    "p95_ms": 1000 * percentile(values, 95),
+                    "p99_ms": 1000 * percentile(values, 99),
+                    "max_ms": 1000 * values[-1],
+                }
+            peaks = [p for p in (peak_rss_bytes(), self.worker_peak_rss) if p]
+            return {
+                "images": count,
+                "elapsed_s": elapsed,
+                "images_per_sec": count / elapsed if elapsed > 0 else 0.0,
+                "peak_rss_bytes": max(peaks) if peaks else None,
+                "read_bytes": self.read_bytes,
+                "read_mb_per_s": (self.read_bytes / (1024 * 1024) / self.read_seconds
+                                  if self.read_seconds > 0 else None),
+                "stall_s": sum(v for v in self.columns["stall"] if not math.isnan(v)),
+                "steps": steps,
+            }
+    
+    def format_summary(self, summary=None):
+        s = summary or self.summary()
+        lines = [f"{s['images']} image(s) in {s['elapsed_s']:.1f}s "
+                 f"({s['images_per_sec']:.2f} images/s)"]
+        if s["peak_rss_bytes"]:
+            lines[0] += f", peak RSS {s['peak_rss_bytes'] / (1024 * 1024):.0f} MB"
+        if s.get("read_mb_per_s"):
+            lines.append(f"read {s['read_bytes'] / (1024 * 1024):.1f} MB at "
+                         f"{s['read_mb_per_s']:.1f} MB/s (decode included)")
+            if "stall" in s["steps"]:
+                lines[-1] += f", stalled {s['stall_s']:.2f}s waiting for prefetched decodes"
+        lines.append(f"{'step':<10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'max ms':>9}")
+        for step, v in s["steps"].items():
+            lines.append(f"{step:<10} {v['p50_ms']:>9.1f} {v['p95_ms']:>9.1f} {v['p99_ms']:>9.1f} "
+                         f"{v['mean_ms']:>9.1f} {v['max_ms']:>9.1f}")
+        return "\n".join(lines)
+    
+    def export_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+    
+    def export_csv(self, path):
+        """One row per image with every step's time in milliseconds"""
+        with self.lock, open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["image"] + [f"{step}_ms" for step in STEPS])
+            for row, label in enumerate(self.labels):
+                values = (self.columns[step][row] for step in STEPS)
+                writer.writerow([label] + ["" if math.isnan(v) else f"{1000 * v:.3f}" for v in values])
+    
+    def export(self, path):
+        """Export as CSV or JSON depending on the file extension"""
+        if path.lower().endswith(".csv"):
+            self.export_csv(path)
+        else:
+            self.export_json(path)
@@ -0,0 +1,324 @@
+"""
+ocr_output.py
+Streaming result writers.
+
+Results are written to disk the moment each image (or page) finishes rather
+than collected in memory, so memory stays flat however large the batch is
+and a crash loses nothing that was already written. Every writer can report
+which inputs it already holds, which is what lets a batch resume where it
+stopped.
+
+Formats:
+    txt       one .txt per image (per page for documents)
+    jsonl     one JSON record per line in results.jsonl
+    combined  all results in one results.txt, plus a small .done manifest
+    words     word boxes and confidences as packed NumPy columns (ocr_words)
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import ocr_words
+from ocr_cache import FILE_MODE
+from ocr_documents import page_label
+
+FORMATS = ("txt", "jsonl", "combined", "words")
+
+
+def result_key(path, page=None):
+    """Identity of one unit of work across runs"""
+    return (os.path.abspath(path), page)
+
+
+def format_block(label, text, position=None):
+    """The ===== FILE: ... ===== block used in the GUI and combined output"""
+    header = f"FILE: {label}" if position is None else f"FILE: {label} ({position})"
+    return f"\n{'='*80}\n{header}\n{'='*80}\n{text}\n{'='*80}\n"
+
+
+class TextFilesWriter:
+    """One .txt per image, next to the image or inside output_dir.
+    
+    Files are named after the image's stem. When two images would share a
+    name (a/scan.png and b/scan.png into one output_dir, or scan.png and
+    scan.jpg in one folder), the first keeps it and the others get a short
+    hash of their path appended. Passing the batch's units up front makes
+    that choice independent of the order results finish in, so a resumed
+    batch finds the same names.
+    """
+    
+    def __init__(self, output_dir=None, fresh=False, units=()):
+        self.output_dir = output_dir
+        self.fresh = fresh
+        self.written = []
+        self.owners = {}            # output path -> abspath of the image that claimed it
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        for _, path, page in units:
+            self.path_for(path, page)
+    
+    def path_for(self, path, page=None):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if page is not None:
+            stem += f"_page{page:04d}"
+        folder = self.output_dir if self.output_dir else os.path.dirname(path)
+        out_path = os.path.join(folder, stem + ".txt")
+        source = os.path.abspath(path)
+        if self.owners.setdefault(out_path, source) != source:
+            digest = hashlib.blake2b(source.encode("utf-8"), digest_size=4).hexdigest()
+            out_path = os.path.join(folder, f"{stem}_{digest}.txt")
+        return out_path
+    
+    def completed(self, units):
+        """Keys of units whose output file already exists (files are written atomically)"""
+        if self.fresh:
+            return set()
+        return {result_key(path, page) for _, path, page in units
+                if os.path.exists(self.path_for(path, page))}
+    
+    def write(self, path, page, text, stats=None):
+        out_path = self.path_for(path, page)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(out_path) or ".", suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, out_path)
+        self.written.append((path, page))
+        return out_path
+    
+    def export_text(self, dest):
+        """Write every result of this session into one text file"""
+        with open(dest, 'w', encoding='utf-8') as out:
+            for path, page in self.written:
+                with open(self.path_for(path, page), 'r', encoding='utf-8') as f:
+                    out.write(format_block(page_label(path, page), f.read()))
+    
+    def close(self):
+        pass
+
+
+class JSONLWriter:
+    """Append-only JSON Lines file, flushed after every record"""
+    
+    def __init__(self, output_path, fresh=False):
+        self.output_path = output_path
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        if fresh and os.path.exists(output_path):
+            os.remove(output_path)
+        self._done = self._scan()
+        self.file = open(output_path, 'a', encoding='utf-8')
+    
+    def _scan(self):
+        """Keys already in the file; a torn last line from a crash is cut off"""
+        done = set()
+        if not os.path.exists(self.output_path):
+            return done
+        good_end = 0
+        with open(self.output_path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                done.add(result_key(record["path"], record.get("page")))
+                good_end += len(line)
+        if good_end != os.path.getsize(self.output_path):
+            with open(self.output_path, 'r+b') as f:
+                f.truncate(good_end)
+        return done
+    
+    def completed(self, units):
+        return {result_key(path, page) for _, path, page in units} & self._done
+    
+    def write(self, path, page, text, stats=None):
+        record = {"path": os.path.abspath(path), "page": page, "text": text}
+        if stats:
+            record["stats"] = {key: value for key, value in stats.items() if key != "words"}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        return self.output_path
+    
+    def export_text(self, dest):
+        if not self.file.closed:
+            self.file.flush()
+        with open(self.output_path, 'r', encoding='utf-8') as f, \
+             open(dest, 'w', encoding='utf-8') as out:
+            for line in f:
+                record = json.loads(line)
+                out.write(format_block(page_label(record["path"], record.get("page")),
+                                       record["text"]))
+    
+    def close(self):
+        self.file.close()
+
+
+class CombinedWriter:
+    """Every result appended to one text file; a sidecar manifest records what is done"""
+    
+    def __init__(self, output_path, fresh=False):
+        self.output_path = output_path
+        self.manifest_path = output_path + ".done"
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        if fresh:
+            for p in (output_path, self.manifest_path):
+                if os.path.exists(p):
+                    os.remove(p)
+        self._done = set()
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self._done.add(result_key(entry["path"], entry.get("page")))
+        self.file = open(output_path, 'a', encoding='utf-8')
+        self.manifest = open(self.manifest_path, 'a', encoding='utf-8')
+    
+    def completed(self, units):
+        return {result_key(path, page) for _, path, page in units} & self._done
+    
+    def write(self, path, page, text, stats=None):
+        details = []
+        if stats and "lang" in stats:
+            details.append(f"lang {stats['lang']}")
+        if stats and "confidence" in stats:
+            details.append(f"confidence {stats['confidence']:g}")
+        detail = ", ".join(details) or None
+        self.file.write(format_block(page_label(path, page), text, detail))
+        self.file.flush()
+        # Only mark done once the text itself is on disk
+        self.manifest.write(json.dumps({"path": os.path.abspath(path), "page": page}) + "\n")
+        self.manifest.flush()
+        return self.output_path
+    
+    def export_text(self, dest):
+        if not self.file.closed:
+            self.file.flush()
+        with open(self.output_path, 'r', encoding='utf-8') as f, \
+             open(dest, 'w', encoding='utf-8') as out:
+            for chunk in iter(lambda: f.read(1024 * 1024), ''):
+                out.write(chunk)
+    
+    def close(self):
+        self.file.close()
+        self.manifest.close()
+
+
+class WordsWriter:
+    """Every page's word boxes streamed to packed NumPy files (see ocr_words).
+    
+    Memory holds one page at a time. A page is marked done in the index only
+    after its rows and strings are on disk, and reopening cuts the files back
+    to the last indexed page, so a crash loses at most the page being written.
+    """
+    
+    def __init__(self, output_dir, fresh=False):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.rows_path = os.path.join(output_dir, ocr_words.ROWS_NAME)
+        self.text_path = os.path.join(output_dir, ocr_words.TEXT_NAME)
+        self.pages_path = os.path.join(output_dir, ocr_words.PAGES_NAME)
+        if fresh:
+            for p in (self.rows_path, self.text_path, self.pages_path):
+                if os.path.exists(p):
+                    os.remove(p)
+        self._done = set()
+        self.pages = 0
+        self.count = 0
+        self.text_end = 0
+        self._scan()
+        
+        self.rows_file = open(self.rows_path, 'r+b' if os.path.exists(self.rows_path) else 'w+b')
+        self.rows_file.truncate(ocr_words.NPY_HEADER_BYTES + self.count * ocr_words.WORD_DTYPE.itemsize)
+        self._write_header()
+        self.rows_file.seek(0, os.SEEK_END)
+        self.text_file = open(self.text_path, 'ab')
+        self.text_file.truncate(self.text_end)
+        self.pages_file = open(self.pages_path, 'a', encoding='utf-8')
+    
+    def _scan(self):
+        """Pages already in the index; a torn last line from a crash is cut off"""
+        if not os.path.exists(self.pages_path):
+            return
+        good_end = 0
+        with open(self.pages_path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self._done.add(result_key(record["path"], record.get("page")))
+                self.pages += 1
+                self.count = record["first"] + record["count"]
+                self.text_end = record["text_end"]
+                good_end += len(line)
+        if good_end != os.path.getsize(self.pages_path):
+            with open(self.pages_path, 'r+b') as f:
+                f.truncate(good_end)
+    
+    def _write_header(self):
+        self.rows_file.seek(0)
+        self.rows_file.write(ocr_words.npy_header(self.count))
+    
+    def completed(self, units):
+        return {result_key(path, page) for _, path, page in units} & self._done
+    
+    def write(self, path, page, text, stats=None):
+        words = ocr_words.page_words(stats) if stats else ocr_words.WordBoxes()
+        rows = words.rows.copy()
+        rows["page_id"] = self.pages
+        rows["text_start"] += self.text_end
+        self.text_file.write(words.blob)
+        self.text_file.flush()
+        rows.tofile(self.rows_file)
+        self.count += len(rows)
+        self.text_end += len(words.blob)
+        self._write_header()
+        self.rows_file.seek(0, os.SEEK_END)
+        self.rows_file.flush()
+        
+        record = {"path": os.path.abspath(path), "page": page, "first": self.count - len(rows),
+                  "count": len(rows), "text_end": self.text_end, "text": text}
+        self.pages_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.pages_file.flush()
+        self.pages += 1
+        self._done.add(result_key(path, page))
+        return self.rows_path
+    
+    def export_text(self, dest):
+        if not self.pages_file.closed:
+            self.pages_file.flush()
+        with open(self.pages_path, 'r', encoding='utf-8') as f, \
+             open(dest, 'w', encoding='utf-8') as out:
+            for line in f:
+                record = json.loads(line)
+                out.write(format_block(page_label(record["path"], record.get("page")),
+                                       record["text"]))
+    
+    def close(self):
+        self.rows_file.close()
+        self.text_file.close()
+        self.pages_file.close()
+
+
+def make_writer(fmt, output_dir=None, fresh=False, units=()):
+    """Writer for a format; jsonl/combined write results.jsonl / results.txt in output_dir,
+    words writes the ocr_words files there. units, the batch's (index, path, page)
+    work units if known up front, fix the txt file names (see TextFilesWriter)."""
+    if fmt == "txt":
+        return TextFilesWriter(output_dir, fresh, units)
+    folder = output_dir or "."
+    if fmt == "jsonl":
+        return JSONLWriter(os.path.join(folder, "results.jsonl"), fresh)
+    if fmt == "combined":
+        return CombinedWriter(os.path.join(folder, "results.txt"), fresh)
+    if fmt == "words":
+        return WordsWriter(folder, fresh)
+    raise ValueError(f"Unknown output format: {fmt}")
@@ -0,0 +1,240 @@
+"""
+ocr_pipeline.py
+Staged OCR pipeline: decode -> preprocess -> recognize -> write.
+
+Each stage runs its own pool of threads and hands work to the next stage
+through a bounded queue, so a slow stage applies back-pressure instead of
+letting decoded images pile up in memory. OpenCV and Tesseract both release
+the GIL for their heavy lifting, which is what lets the stages overlap.
+
+Per-stage throughput, busy time and queue depth are available from
+OCRPipeline.stats() and are logged periodically while a batch runs, which
+shows at a glance whether a batch is bound by denoising or by recognition.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+import ocr_backend
+import ocr_engine
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Stage:
+    """A named step with its own worker threads and bounded input queue"""
+    
+    def __init__(self, name, func, workers=1, queue_size=8, run_on_error=False, on_exit=None):
+        self.name = name
+        self.func = func
+        self.run_on_error = run_on_error
+        self.on_exit = on_exit      # called by each worker thread as it stops
+        self.workers = max(1, int(workers))
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.next = None
+        self.processed = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+        self.threads = []
+        self._alive = 0
+    
+    def start(self):
+        self._alive = self.workers
+        self.threads = [threading.Thread(target=self._run, name=f"ocr-{self.name}-{n}", daemon=True)
+                        for n in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+    
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            
+            elapsed = 0.0
+            if item.get("error") is None or self.run_on_error:
+                start = time.perf_counter()
+                try:
+                    self.func(item)
+                except Exception as e:
+                    item["error"] = str(e)
+                elapsed = time.perf_counter() - start
+            
+            with self.lock:
+                self.processed += 1
+                self.busy += elapsed
+            
+            if self.next:
+                self.next.queue.put(item)
+        
+        if self.on_exit:
+            self.on_exit()
+        # The last worker out tells the next stage there is nothing more coming
+        with self.lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last and self.next:
+            for _ in range(self.next.workers):
+                self.next.queue.put(_STOP)
+
+
+class OCRPipeline:
+    """Run a batch of images through bounded, concurrently running stages.
+    
+    sink(item) is called from the write stage for every image, in completion
+    order. item is a dict with index, path, page, text, stats and error keys.
+    cancel() stops feeding new images; those already in the stages are
+    finished and sunk as usual.
+    """
+    
+    def __init__(self, settings, sink, decode_workers=2, preprocess_workers=None,
+                 recognize_workers=None, write_workers=1, queue_size=8,
+                 on_stats=None, stats_interval=2.0):
+        cores = ocr_engine.default_workers()
+        self.settings = settings
+        self.sink = sink
+        self.on_stats = on_stats
+        self.stats_interval = stats_interval
+        self.started = None
+        self.cancelled = threading.Event()
+        
+        self.stages = [
+            Stage("decode", self._decode, decode_workers, queue_size),
+            Stage("preprocess", self._preprocess, preprocess_workers or cores, queue_size),
+            # Recognition threads own their Tesseract engines; free them when the batch ends,
+            # since the GUI process runs one pipeline after another
+            Stage("recognize", self._recognize, recognize_workers or cores, queue_size,
+                  on_exit=ocr_backend.close_thread_backends),
+            # The write stage also reports failed images, so it always runs
+            Stage("write", self._write, write_workers, queue_size, run_on_error=True),
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next = next_stage
+    
+    # ---- stage functions ----
+    
+    def _decode(self, item):
+        # Oversized scans are decoded and processed strip by strip in the recognize stage
+        item["tiled"] = (item["page"] is None and
+                         ocr_engine.needs_tiling(item["path"], self.settings))
+        if item["tiled"]:
+            item["dpi"] = None
+            return
+        item["image"], item["dpi"] = ocr_engine.read_source(item["path"], self.settings,
+                                                            item["page"], item["stats"])
+    
+    def _preprocess(self, item):
+        if item["tiled"]:
+            return
+        if self.settings.normalize:
+            item["image"], item["dpi"] = ocr_engine.normalize_resolution(item["image"], item["dpi"],
+                                                                         item["stats"])
+        item["settings"] = ocr_engine.language_settings(item["image"], self.settings, item["dpi"],
+                                                        item["stats"])
+        # Layout runs on the unprocessed page; two-pass mode preprocesses only what its
+        # first pass can't read, and blank pages aren't preprocessed at all
+        item["regions"] = ocr_engine.page_regions(item["image"], self.settings, item["stats"])
+        if self.settings.preprocess and not self.settings.two_pass and item["regions"] != []:
+            item["image"] = ocr_engine.preprocess_array(item["image"], self.settings.profile,
+                                                        item["stats"])
+    
+    def _recognize(self, item):
+        if item["tiled"]:
+            item["text"] = ocr_engine.extract_text_tiled(item["path"], self.settings, item["stats"])
+            return
+        item["text"] = ocr_engine.recognize_page(item.pop("image"), item.pop("settings"),
+                                                 item["dpi"], item["stats"],
+                                                 regions=item.pop("regions"))
+    
+    def _write(self, item):
+        # Drop the pixels as soon as possible, even for failed items
+        item.pop("image", None)
+        if item.get("error") is not None:
+            item["text"] = f"{ocr_engine.ERROR_PREFIX}{item['error']}"
+        # Worker-side time for the image is the sum of its own stage times
+        timings = item["stats"].get("timings")
+        if timings:
+            timings["total"] = sum(timings.values())
+        self.sink(item)
+    
+    # ---- running ----
+    
+    def run(self, units):
+        """Process (index, path) or (index, path, page) work units; blocks until every
+        image has been written"""
+        self.started = time.perf_counter()
+        for stage in self.stages:
+            stage.start()
+        
+        done = threading.Event()
+        monitor = threading.Thread(target=self._monitor, args=(done,), daemon=True)
+        monitor.start()
+        
+        first = self.stages[0]
+        for unit in units:
+            if self.cancelled.is_set():
+                break
+            index, path = unit[0], unit[1]
+            page = unit[2] if len(unit) > 2 else None
+            stats = {} if page is None else {"page": page}
+            first.queue.put({"index": index, "path": path, "page": page, "text": "",
+                             "stats": stats, "error": None})
+        for _ in range(first.workers):
+            first.queue.put(_STOP)
+        
+        for stage in self.stages:
+            for thread in stage.threads:
+                thread.join()
+        
+        done.set()
+        monitor.join()
+        self._report()
+    
+    def cancel(self):
+        """Stop after the images already in the pipeline; safe to call from any thread"""
+        self.cancelled.set()
+    
+    def _monitor(self, done):
+        while not done.wait(self.stats_interval):
+            self._report()
+    
+    def _report(self):
+        log.info("pipeline %s", self.format_stats())
+        if self.on_stats:
+            self.on_stats(self.stats())
+    
+    def stats(self):
+        """Per-stage processed count, throughput, busy time, utilisation and queue depth"""
+        elapsed = max(time.perf_counter() - (self.started or time.perf_counter()), 1e-9)
+        result = []
+        for stage in self.stages:
+            with stage.lock:
+                processed, busy = stage.processed, stage.busy
+            result.append({
+                "stage": stage.name,
+                "workers": stage.workers,
+                "processed": processed,
+                "per_sec": processed / elapsed,
+                "busy_s": busy,
+                "utilisation": busy / (elapsed * stage.workers),
+                "queue_depth": stage.queue.qsize(),
+                "queue_size": stage.queue.maxsize,
+            })
+        return result
+    
+    def format_stats(self, stats=None):
+        """One-line summary, e.g. 'decode 40.1/s q=0/8 | preprocess 3.2/s q=8/8 ...'"""
+        parts = []
+        for s in stats or self.stats():
+            parts.append(f"{s['stage']} {s['per_sec']:.1f}/s "
+                         f"q={s['queue_depth']}/{s['queue_size']} "
+                         f"busy={s['utilisation']:.0%}")
+        return " | ".join(parts)
+    
+    def bottleneck(self, stats=None):
+        """Name of the stage with the highest per-worker utilisation"""
+        return max(stats or self.stats(), key=lambda s: s["utilisation"])["stage"]
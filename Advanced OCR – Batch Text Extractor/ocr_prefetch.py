@@ -0,0 +1,162 @@
+"""
+ocr_prefetch.py
+File reads for decoding, and a reader that decodes ahead of the consumer.
+
+Local files are memory-mapped and handed to cv2.imdecode as they are, so
+the encoded bytes are never copied into Python. Files on network shares
+(NFS, SMB, sshfs, ...) are read in one sequential read instead: page
+faults on a mapped remote file turn into many small synchronous round
+trips, and a file truncated on the server would crash a reader mid-decode.
+
+Prefetcher runs the loads for the next few items on background threads
+while the current one is processed, so a worker waiting on a slow share
+only stalls when the reader has fallen behind. It is bounded both by item
+count and by the decoded bytes it holds.
+"""
+
+import mmap
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Filesystem types treated as remote (Linux /proc/mounts names)
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "ncpfs", "afs", "9p", "ceph",
+                       "glusterfs", "lustre", "davfs", "fuse.sshfs", "fuse.rclone", "fuse.s3fs",
+                       "fuse.gcsfuse"}
+
+DEFAULT_AHEAD = 4
+DEFAULT_BUDGET_BYTES = 256 * 1024 * 1024
+DEFAULT_THREADS = 2
+
+_END = object()
+_mounts = None
+
+
+def _mount_table():
+    """[(mount point, fs type)] longest first; empty where /proc/mounts doesn't exist"""
+    global _mounts
+    if _mounts is None:
+        mounts = []
+        try:
+            with open("/proc/mounts", 'r', encoding='utf-8') as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 3:
+                        # Spaces in mount points are escaped as \040
+                        mounts.append((fields[1].replace("\\040", " "), fields[2]))
+        except OSError:
+            pass
+        _mounts = sorted(mounts, key=lambda m: len(m[0]), reverse=True)
+    return _mounts
+
+
+def is_network_path(path):
+    """True if path is on a network share (UNC path, or a remote mount on Linux)"""
+    path = os.path.abspath(path)
+    if path.startswith("\\\\"):
+        return True
+    real = os.path.realpath(path)
+    for mount_point, fs_type in _mount_table():
+        if real == mount_point or real.startswith(mount_point.rstrip("/") + "/"):
+            return fs_type in NETWORK_FILESYSTEMS
+    return False
+
+
+def read_file(path):
+    """The whole file as a buffer cv2.imdecode accepts.
+    
+    Local files come back as a read-only mmap (close it when done), files on
+    network shares as bytes from one sequential read.
+    """
+    with open(path, 'rb') as f:
+        if not is_network_path(path) and os.fstat(f.fileno()).st_size:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return f.read()
+
+
+def release(data):
+    """Unmap a buffer from read_file; one still viewed by an array is unmapped with its last view"""
+    if isinstance(data, mmap.mmap):
+        try:
+            data.close()
+        except BufferError:
+            pass
+
+
+class Prefetcher:
+    """Iterate over load(item) for items in order, loading the next ones in the background.
+    
+    load returns (result, nbytes), nbytes being the memory the result holds.
+    At most `ahead` items are loading or loaded but not yet taken, and no
+    load starts while those would hold more than budget_bytes (loads still
+    running count at the mean size so far); the next item always may load.
+    Yields (item, result, error, stall): error is the exception load raised,
+    stall the seconds the consumer waited for this item. With ahead=0
+    everything loads synchronously and stall is 0.
+    """
+    
+    def __init__(self, items, load, ahead=DEFAULT_AHEAD, budget_bytes=DEFAULT_BUDGET_BYTES,
+                 threads=DEFAULT_THREADS):
+        self.items = items
+        self.load = load
+        self.ahead = max(0, int(ahead))
+        self.budget_bytes = budget_bytes
+        self.threads = max(1, int(threads))
+        self.loaded = 0
+        self.loaded_bytes = 0
+        self.stall = 0.0
+    
+    def _record(self, nbytes):
+        self.loaded += 1
+        self.loaded_bytes += nbytes
+    
+    def __iter__(self):
+        if not self.ahead:
+            for item in self.items:
+                try:
+                    result, nbytes = self.load(item)
+                except Exception as e:
+                    yield item, None, e, 0.0
+                    continue
+                self._record(nbytes)
+                yield item, result, None, 0.0
+            return
+        
+        pending = iter(self.items)
+        window = deque()
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="ocr-prefetch") as pool:
+            def fill():
+                while len(window) < self.ahead:
+                    if window and self._held(window) > self.budget_bytes:
+                        return
+                    item = next(pending, _END)
+                    if item is _END:
+                        return
+                    window.append((item, pool.submit(self.load, item)))
+            
+            fill()
+            while window:
+                item, future = window.popleft()
+                start = time.perf_counter()
+                error = future.exception()
+                stall = time.perf_counter() - start
+                self.stall += stall
+                result = None
+                if error is None:
+                    result, nbytes = future.result()
+                    self._record(nbytes)
+                # Start the next loads before handing this item over, so they overlap with it
+                fill()
+                yield item, result, error, stall
+    
+    def _held(self, window):
+        """Bytes the window would hold with one more load started"""
+        mean = self.loaded_bytes / self.loaded if self.loaded else 0
+        held = 0
+        for _, future in window:
+            if future.done() and future.exception() is None:
+                held += future.result()[1]
+            else:
+                held += mean
+        return held + mean
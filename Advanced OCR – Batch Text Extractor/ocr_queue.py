@@ -0,0 +1,234 @@
+"""
+ocr_queue.py
+Indexed image queue that recognises duplicate content.
+
+Paths are looked up in a dict, so adding a file is O(1) however long the
+queue is. Each new file is also matched against the queue by content:
+files are bucketed by size (one stat call), and only files whose size
+collides with an earlier entry are sampled and, if the samples match,
+hashed in full. Copies of the same scan under different names therefore
+cost one OCR job, and their result is fanned out to every alias.
+
+Optionally near-duplicates are folded together too, e.g. the same page saved
+twice with different JPEG quality. A perceptual hash (dHash) only finds
+candidates; 64 bits can't tell two pages of body text apart, so a candidate
+is merged only if a 256-pixel-wide rendering of both images matches closely
+everywhere, which a single changed line of text does not.
+"""
+
+import hashlib
+import os
+
+import cv2
+import numpy as np
+
+import ocr_documents
+from ocr_cache import file_digest
+from ocr_engine import INPUT_EXTENSIONS
+
+SAMPLE_BYTES = 64 * 1024
+# Max differing bits for two dHashes to count as the same image; the hash is
+# split into PHASH_MAX_DISTANCE + 1 bands so any match shares at least one band
+PHASH_MAX_DISTANCE = 3
+PHASH_BANDS = PHASH_MAX_DISTANCE + 1
+PHASH_BAND_BITS = 64 // PHASH_BANDS
+# Entries kept per band; near-uniform images all share bands and would otherwise make
+# every lookup scan (and confirm against) the whole queue
+PHASH_BAND_LIMIT = 32
+# Candidates are confirmed on thumbnails CONFIRM_WIDTH wide: the mean grey-level difference
+# over every CONFIRM_CELL x CONFIRM_CELL cell must stay within CONFIRM_MAX_DIFF. Re-encoded or
+# rescaled copies of a page stay under 10; a page with one line of text changed exceeds 100.
+CONFIRM_WIDTH = 256
+CONFIRM_CELL = 4
+CONFIRM_MAX_DIFF = 32
+# Aspect ratios (height / width) further apart than this are never the same image
+CONFIRM_MAX_ASPECT_DIFF = 0.02
+
+
+def find_inputs(folder):
+    """Image and document files under folder, recursively, in sorted order per directory"""
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if not name.startswith(".") and name.lower().endswith(INPUT_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def sample_fingerprint(path, size):
+    """Hash of a file's size, head and tail; equal for identical files, cheap for large ones"""
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        h.update(f.read(SAMPLE_BYTES))
+        if size > 2 * SAMPLE_BYTES:
+            f.seek(-SAMPLE_BYTES, os.SEEK_END)
+            h.update(f.read(SAMPLE_BYTES))
+    return h.hexdigest()
+
+
+def perceptual_hash(path):
+    """64-bit difference hash of the image's 9x8 grayscale thumbnail, or None if unreadable"""
+    gray = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        return None
+    thumb = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def confirm_thumbnail(path):
+    """Full-resolution grayscale image scaled to CONFIRM_WIDTH wide, or None if unreadable"""
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None
+    height = max(1, round(CONFIRM_WIDTH * gray.shape[0] / gray.shape[1]))
+    return cv2.resize(gray, (CONFIRM_WIDTH, height), interpolation=cv2.INTER_AREA)
+
+
+def same_image(a, b):
+    """Whether two confirm thumbnails show the same picture, cell by cell"""
+    aspect_a, aspect_b = a.shape[0] / a.shape[1], b.shape[0] / b.shape[1]
+    if abs(aspect_a - aspect_b) > CONFIRM_MAX_ASPECT_DIFF * max(aspect_a, aspect_b):
+        return False
+    if b.shape != a.shape:
+        b = cv2.resize(b, (a.shape[1], a.shape[0]), interpolation=cv2.INTER_AREA)
+    diff = cv2.absdiff(a, b).astype(np.float32)
+    grid = (max(1, a.shape[1] // CONFIRM_CELL), max(1, a.shape[0] // CONFIRM_CELL))
+    cells = cv2.resize(diff, grid, interpolation=cv2.INTER_AREA)
+    return float(cells.max()) <= CONFIRM_MAX_DIFF
+
+
+class ImageQueue:
+    """Ordered queue of paths with O(1) path lookup and content de-duplication"""
+    
+    def __init__(self, near_duplicates=False):
+        self.near_duplicates = near_duplicates
+        self.clear()
+    
+    def clear(self):
+        self.paths = []
+        self.index = {}             # abspath -> position
+        self.canonical = []         # position -> position of the entry OCR'd in its place
+        self.by_size = {}           # file size -> canonical positions not yet sampled
+        self.by_sample = {}         # (size, sample fingerprint) -> canonical positions
+        self.by_band = {}           # (band, bits) -> positions with that dHash band
+        self.fingerprints = {}      # position -> (sample fingerprint, full digest), lazily
+        self.phashes = {}           # position -> dHash
+        self.duplicates = 0
+    
+    def __len__(self):
+        return len(self.paths)
+    
+    def __iter__(self):
+        return iter(self.paths)
+    
+    def __contains__(self, path):
+        return os.path.abspath(path) in self.index
+    
+    def add(self, path):
+        """Append a path; returns its position, or None if the path is already queued"""
+        key = os.path.abspath(path)
+        if key in self.index:
+            return None
+        position = len(self.paths)
+        # canonical grows first, so a reader on another thread never sees a path without one
+        self.canonical.append(position)
+        self.paths.append(path)
+        self.index[key] = position
+        original = self._find_original(position, path)
+        self.canonical[position] = original
+        if original != position:
+            self.duplicates += 1
+        return position
+    
+    def original_of(self, position):
+        """Path whose OCR result is reused for this entry, or None if it is its own job"""
+        c = self.canonical[position]
+        return None if c == position else self.paths[c]
+    
+    def snapshot(self):
+        """(paths, canonical) copies for a batch running on another thread"""
+        return list(self.paths), list(self.canonical)
+    
+    def _find_original(self, position, path):
+        """Position of an earlier entry with the same content, else this position"""
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            # Let the batch report the unreadable file
+            return position
+        
+        # Only a size collision costs any reading; from then on entries of that size
+        # are found by a dict lookup on their sample, not by comparing against each
+        sample_key = None
+        if size in self.by_size:
+            try:
+                for other in self.by_size[size]:
+                    self.by_sample.setdefault((size, self._fingerprint(other, size)), []).append(other)
+                self.by_size[size] = []
+                sample_key = (size, self._fingerprint(position, size))
+            except OSError:
+                return position
+            for other in self.by_sample.get(sample_key, ()):
+                if self._same_content(other, position, size):
+                    return other
+        
+        # Documents are never matched by their first page alone
+        if self.near_duplicates and not ocr_documents.is_document(path):
+            match = self._find_near_duplicate(position, path)
+            if match is not None:
+                return match
+        
+        if sample_key is None:
+            self.by_size[size] = [position]
+        else:
+            self.by_sample.setdefault(sample_key, []).append(position)
+        return position
+    
+    def _fingerprint(self, position, size, full=False):
+        sample, digest = self.fingerprints.get(position, (None, None))
+        path = self.paths[position]
+        if sample is None:
+            sample = sample_fingerprint(path, size)
+        if full and digest is None:
+            digest = file_digest(path)
+        self.fingerprints[position] = (sample, digest)
+        return digest if full else sample
+    
+    def _same_content(self, a, b, size):
+        try:
+            if self._fingerprint(a, size) != self._fingerprint(b, size):
+                return False
+            # Samples only cover head and tail; confirm with the whole file
+            return size <= 2 * SAMPLE_BYTES or \
+                self._fingerprint(a, size, full=True) == self._fingerprint(b, size, full=True)
+        except OSError:
+            return False
+    
+    def _find_near_duplicate(self, position, path):
+        phash = perceptual_hash(path)
+        if phash is None:
+            return None
+        mask = (1 << PHASH_BAND_BITS) - 1
+        bands = [(band, (phash >> (PHASH_BAND_BITS * band)) & mask) for band in range(PHASH_BANDS)]
+        thumbnail = None
+        seen = set()
+        for band in bands:
+            for other in self.by_band.get(band, ()):
+                distance = bin(phash ^ self.phashes[other]).count("1")
+                if other in seen or distance > PHASH_MAX_DISTANCE:
+                    continue
+                seen.add(other)
+                # A hash match is only a candidate; compare the pictures before merging
+                if thumbnail is None:
+                    thumbnail = confirm_thumbnail(path)
+                    if thumbnail is None:
+                        return None
+                other_thumbnail = confirm_thumbnail(self.paths[other])
+                if other_thumbnail is not None and same_image(thumbnail, other_thumbnail):
+                    return other
+        self.phashes[position] = phash
+        for band in bands:
+            positions = self.by_band.setdefault(band, [])
+            if len(positions) < PHASH_BAND_LIMIT:
+                positions.append(position)
+        return None
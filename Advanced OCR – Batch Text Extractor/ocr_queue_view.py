@@ -0,0 +1,236 @@
+"""
+ocr_queue_view.py
+Virtualised queue list for the GUI.
+
+A Canvas that draws only the rows in view, so a queue of 50k files costs
+the same to show and scroll as one of 50: there is one set of canvas
+items per visible row, refilled from the model whenever the view moves.
+Each row shows a thumbnail, the file name and a status/timing column.
+
+Thumbnails are decoded on a background thread into a bounded LRU cache.
+Only rows on screen ask for one, and requests for rows that have since
+been scrolled away are dropped before they are decoded.
+"""
+
+import threading
+import tkinter as tk
+from collections import OrderedDict
+from tkinter import ttk
+
+from PIL import Image, ImageTk
+
+import ocr_documents
+
+THUMB_SIZE = 32
+THUMB_CACHE_SIZE = 512
+ROW_HEIGHT = THUMB_SIZE + 6
+STATUS_WIDTH = 110
+CHAR_WIDTH = 7      # Courier 9, for truncating names to the row width
+
+# Row background per status; rows without a status are still queued
+STATUS_COLOURS = {
+    "done": "light green",
+    "cached": "light green",
+    "partial": "light yellow",
+    "failed": "#f4c7c3",
+}
+
+
+def load_thumbnail(path, size=THUMB_SIZE):
+    """Small RGB preview of an image file, or None (documents, unreadable files)"""
+    if ocr_documents.is_document(path) and path.lower().endswith(".pdf"):
+        return None
+    try:
+        with Image.open(path) as img:
+            # JPEGs can be decoded straight at a fraction of their size
+            img.draft("RGB", (size, size))
+            img.thumbnail((size, size))
+            return img.convert("RGB")
+    except Exception:
+        return None
+
+
+class ThumbnailLoader:
+    """Background thread decoding thumbnails for the paths currently wanted.
+    
+    want() replaces the set of wanted paths; anything no longer wanted is
+    skipped. Decoded thumbnails are collected with take_ready() on the Tk
+    thread, where they become PhotoImages.
+    """
+    
+    def __init__(self, size=THUMB_SIZE):
+        self.size = size
+        self.cond = threading.Condition()
+        self.wanted = []
+        self.ready = []
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="ocr-thumbnails", daemon=True)
+        self.thread.start()
+    
+    def want(self, paths):
+        with self.cond:
+            self.wanted = list(paths)
+            self.cond.notify()
+    
+    def take_ready(self):
+        """[(path, PIL image or None)] decoded since the last call"""
+        with self.cond:
+            ready, self.ready = self.ready, []
+        return ready
+    
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+    
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.wanted and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                path = self.wanted.pop(0)
+            thumb = load_thumbnail(path, self.size)
+            with self.cond:
+                self.ready.append((path, thumb))
+
+
+class QueueView(ttk.Frame):
+    """Scrollable queue list that only renders visible rows.
+    
+    count() returns the number of rows; row(i) returns (path, label, status,
+    detail) for row i, status being a STATUS_COLOURS key or "".
+    """
+    
+    def __init__(self, parent, count, row, thumbnails=True, cache_size=THUMB_CACHE_SIZE):
+        super().__init__(parent)
+        self.count = count
+        self.row = row
+        self.top = 0
+        self.slots = []
+        self.photos = OrderedDict()     # path -> PhotoImage, or None if it has no thumbnail
+        self.cache_size = cache_size
+        self.loader = ThumbnailLoader() if thumbnails else None
+        
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+        self.canvas = tk.Canvas(self, background="white", highlightthickness=0,
+                                height=15 * ROW_HEIGHT)
+        self.canvas.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.scrollbar = ttk.Scrollbar(self, command=self.yview)
+        self.scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        
+        self.canvas.bind("<Configure>", lambda event: self.refresh())
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        self.canvas.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll(3))
+    
+    # ---- scrolling ----
+    
+    def visible_rows(self):
+        return max(1, self.canvas.winfo_height() // ROW_HEIGHT)
+    
+    def yview(self, *args):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')"""
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * self.count())
+        elif args[0] == "scroll":
+            step = self.visible_rows() if args[2] == "pages" else 1
+            self.top += int(args[1]) * step
+        self.refresh()
+    
+    def scroll(self, rows):
+        self.top += rows
+        self.refresh()
+    
+    def _on_wheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        self.scroll(-3 if event.delta > 0 else 3)
+    
+    def see(self, i):
+        """Scroll just enough to bring row i into view"""
+        visible = self.visible_rows()
+        if i < self.top:
+            self.top = i
+        elif i >= self.top + visible:
+            self.top = i - visible + 1
+        self.refresh()
+    
+    # ---- drawing ----
+    
+    def _slot(self, k):
+        while len(self.slots) <= k:
+            y = len(self.slots) * ROW_HEIGHT
+            c = self.canvas
+            self.slots.append({
+                "bg": c.create_rectangle(0, y, 0, y + ROW_HEIGHT, width=0, fill="white"),
+                "image": c.create_image(3, y + ROW_HEIGHT // 2, anchor=tk.W),
+                "label": c.create_text(THUMB_SIZE + 10, y + ROW_HEIGHT // 2, anchor=tk.W,
+                                       font=("Courier", 9)),
+                "status": c.create_text(0, y + ROW_HEIGHT // 2, anchor=tk.E, font=("Courier", 9)),
+            })
+        return self.slots[k]
+    
+    def refresh(self):
+        """Redraw the rows in view from the model (cheap: one set of items per visible row)"""
+        total = self.count()
+        visible = self.visible_rows()
+        self.top = max(0, min(self.top, total - visible))
+        width = self.canvas.winfo_width()
+        max_chars = max(8, (width - THUMB_SIZE - STATUS_WIDTH - 16) // CHAR_WIDTH)
+        c = self.canvas
+        
+        paths = []
+        for k in range(max(visible + 1, len(self.slots))):
+            slot = self._slot(k)
+            i = self.top + k
+            if i >= total or k > visible:
+                for item in slot.values():
+                    c.itemconfigure(item, state=tk.HIDDEN)
+                continue
+            path, label, status, detail = self.row(i)
+            paths.append(path)
+            y = k * ROW_HEIGHT
+            c.coords(slot["bg"], 0, y, width, y + ROW_HEIGHT)
+            c.coords(slot["status"], width - 6, y + ROW_HEIGHT // 2)
+            c.itemconfigure(slot["bg"], state=tk.NORMAL, fill=STATUS_COLOURS.get(status, "white"))
+            if len(label) > max_chars:
+                label = label[:max_chars - 1] + "…"
+            c.itemconfigure(slot["label"], state=tk.NORMAL, text=label)
+            c.itemconfigure(slot["status"], state=tk.NORMAL, text=detail)
+            photo = self.photos.get(path)
+            if path in self.photos:
+                # Rows in view are the most recently used
+                self.photos.move_to_end(path)
+            c.itemconfigure(slot["image"], state=tk.NORMAL, image=photo or "")
+        
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        if self.loader:
+            self.loader.want(p for p in paths if p not in self.photos)
+    
+    def poll_thumbnails(self):
+        """Turn thumbnails decoded since the last call into PhotoImages; call from the Tk thread"""
+        if not self.loader:
+            return
+        ready = self.loader.take_ready()
+        if not ready:
+            return
+        for path, thumb in ready:
+            self.photos[path] = ImageTk.PhotoImage(thumb) if thumb is not None else None
+            self.photos.move_to_end(path)
+        while len(self.photos) > self.cache_size:
+            self.photos.popitem(last=False)
+        self.refresh()
+    
+    def clear(self):
+        self.top = 0
+        self.photos.clear()
+        self.refresh()
+    
+    def close(self):
+        if self.loader:
+            self.loader.close()
@@ -1,15 +1,31 @@
-import pytesseract
-from PIL import Image
-import cv2
-import numpy as np
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
+import logging
 import os
+import queue
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
-# Uncomment and modify the path below if on Windows
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+import ocr_engine
+import ocr_documents
+from ocr_cache import OCRCache
+from ocr_checkpoint import CHECKPOINT_NAME, CheckpointJournal, cancel_pending, run_config
+from ocr_metrics import BatchReport, timed
+from ocr_output import FORMATS, format_block, make_writer, result_key
+from ocr_pipeline import OCRPipeline
+from ocr_queue import ImageQueue, find_inputs
+from ocr_queue_view import QueueView
+
+# The results pane only keeps the tail of a batch; the full output is on disk
+MAX_VIEW_LINES = 5000
+
+# Worker threads never touch Tk; their updates are applied at this frame interval
+UI_FRAME_MS = 50
+UI_MAX_MESSAGES_PER_FRAME = 5000
+
+# While a folder is being added, the queue view is refreshed every this many files
+ADD_PROGRESS_EVERY = 500
 
 class OCRApp:
     def __init__(self, root):
@@ -18,10 +34,22 @@ class OCRApp:
         self.root.geometry("1000x700")
         self.root.resizable(True, True)
         
-        self.image_queue = []
+        self.image_queue = ImageQueue()
+        self.row_status = {}        # queue position -> (status, status column text)
         self.processing = False
+        self.adding = False
+        self.cache = OCRCache()
+        self.pipeline = None
+        self.futures = []
+        self.cancel_event = threading.Event()
+        self.writer = None
+        self.report = None
+        self.output_dir = os.path.join(os.path.expanduser("~"), "OCR Results")
+        self.ui_queue = queue.Queue()
         
         self.setup_ui()
+        self.root.after(UI_FRAME_MS, self.drain_ui_queue)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
     def setup_ui(self):
         # Main container
@@ -48,34 +76,133 @@ class OCRApp:
                                         command=self.add_files, width=15)
         self.add_files_btn.grid(row=0, column=0, padx=5)
         
+        self.add_folder_btn = ttk.Button(button_frame, text="📂 Add Folder", 
+                                         command=self.add_folder, width=15)
+        self.add_folder_btn.grid(row=0, column=1, padx=5)
+        
         self.clear_queue_btn = ttk.Button(button_frame, text="🗑️ Clear Queue", 
                                           command=self.clear_queue, width=15)
-        self.clear_queue_btn.grid(row=0, column=1, padx=5)
+        self.clear_queue_btn.grid(row=0, column=2, padx=5)
         
         self.process_btn = ttk.Button(button_frame, text="▶️ Process All", 
                                       command=self.start_processing, width=15)
-        self.process_btn.grid(row=0, column=2, padx=5)
+        self.process_btn.grid(row=0, column=3, padx=5)
+        
+        # Cooperative stop: images in progress finish and are written, the rest resume later
+        self.stop_btn = ttk.Button(button_frame, text="⏹️ Stop", 
+                                   command=self.stop_processing, width=10, state='disabled')
+        self.stop_btn.grid(row=0, column=4, padx=5)
         
         self.save_btn = ttk.Button(button_frame, text="💾 Save Results", 
                                    command=self.save_results, width=15)
-        self.save_btn.grid(row=0, column=3, padx=5)
+        self.save_btn.grid(row=0, column=5, padx=5)
         
         # Language selection
         lang_frame = ttk.Frame(button_frame)
-        lang_frame.grid(row=0, column=4, padx=20)
+        lang_frame.grid(row=0, column=6, padx=20)
         
         ttk.Label(lang_frame, text="Language:").pack(side=tk.LEFT, padx=5)
         self.language_var = tk.StringVar(value="eng")
+        # Editable, so any combination such as eng+deu can be typed in
         lang_combo = ttk.Combobox(lang_frame, textvariable=self.language_var, 
-                                  values=["eng", "spa", "fra", "deu", "chi_sim", "ara", "hin"], 
-                                  width=10, state="readonly")
+                                  values=["eng", "spa", "fra", "deu", "chi_sim", "ara", "hin", 
+                                          "eng+deu+fra"], 
+                                  width=12)
         lang_combo.pack(side=tk.LEFT)
         
         # Preprocessing option
         self.preprocess_var = tk.BooleanVar(value=True)
         preprocess_check = ttk.Checkbutton(button_frame, text="Enhanced Processing", 
                                           variable=self.preprocess_var)
-        preprocess_check.grid(row=0, column=5, padx=10)
+        preprocess_check.grid(row=0, column=7, padx=10)
+        
+        # Worker process count
+        workers_frame = ttk.Frame(button_frame)
+        workers_frame.grid(row=0, column=8, padx=10)
+        
+        ttk.Label(workers_frame, text="Workers:").pack(side=tk.LEFT, padx=5)
+        self.workers_var = tk.IntVar(value=ocr_engine.default_workers())
+        workers_spin = ttk.Spinbox(workers_frame, from_=1, to=ocr_engine.default_workers(), 
+                                   textvariable=self.workers_var, width=4)
+        workers_spin.pack(side=tk.LEFT)
+        
+        # Second row of batch options
+        options_frame = ttk.Frame(button_frame)
+        options_frame.grid(row=1, column=0, columnspan=9, pady=(8, 0), sticky=tk.W)
+        
+        # Staged pipeline (decode -> preprocess -> recognize -> write) instead of process pool
+        self.pipeline_var = tk.BooleanVar(value=False)
+        pipeline_check = ttk.Checkbutton(options_frame, text="Pipelined Stages", 
+                                         variable=self.pipeline_var)
+        pipeline_check.pack(side=tk.LEFT, padx=5)
+        
+        # Preprocessing profile (auto only runs heavy denoising on noisy images)
+        ttk.Label(options_frame, text="Profile:").pack(side=tk.LEFT, padx=(15, 5))
+        self.profile_var = tk.StringVar(value="auto")
+        profile_combo = ttk.Combobox(options_frame, textvariable=self.profile_var, 
+                                     values=list(ocr_engine.PROFILES), width=9, state="readonly")
+        profile_combo.pack(side=tk.LEFT)
+        
+        # Strip-by-strip processing for very large scans (0 = off)
+        ttk.Label(options_frame, text="Tile Height:").pack(side=tk.LEFT, padx=(15, 5))
+        self.tile_height_var = tk.IntVar(value=0)
+        tile_spin = ttk.Spinbox(options_frame, from_=0, to=20000, increment=500, 
+                                textvariable=self.tile_height_var, width=7)
+        tile_spin.pack(side=tk.LEFT)
+        
+        # Per-image processing toggles on their own row
+        toggles_frame = ttk.Frame(button_frame)
+        toggles_frame.grid(row=2, column=0, columnspan=9, pady=(8, 0), sticky=tk.W)
+        
+        # Rescale each image so its text is a comfortable size for Tesseract
+        self.normalize_var = tk.BooleanVar(value=True)
+        normalize_check = ttk.Checkbutton(toggles_frame, text="Auto Scale", 
+                                          variable=self.normalize_var)
+        normalize_check.pack(side=tk.LEFT, padx=5)
+        
+        # Exact copies always share one OCR job; this also folds visually identical images
+        self.near_dup_var = tk.BooleanVar(value=False)
+        near_dup_check = ttk.Checkbutton(toggles_frame, text="Merge Near-Duplicates", 
+                                         variable=self.near_dup_var, 
+                                         command=self.toggle_near_duplicates)
+        near_dup_check.pack(side=tk.LEFT, padx=(15, 5))
+        
+        # Cheap first pass; only low-confidence pages get the full preprocessing chain
+        self.two_pass_var = tk.BooleanVar(value=False)
+        two_pass_check = ttk.Checkbutton(toggles_frame, text="Two-Pass (by confidence)", 
+                                         variable=self.two_pass_var)
+        two_pass_check.pack(side=tk.LEFT, padx=(15, 5))
+        
+        # Treat the language as candidates and pick one model per image
+        self.detect_language_var = tk.BooleanVar(value=False)
+        detect_check = ttk.Checkbutton(toggles_frame, text="Detect Language", 
+                                       variable=self.detect_language_var)
+        detect_check.pack(side=tk.LEFT, padx=(15, 5))
+        
+        # Layout pre-pass: OCR only the text regions, skip blank pages
+        self.layout_var = tk.BooleanVar(value=False)
+        layout_check = ttk.Checkbutton(toggles_frame, text="Text Regions Only", 
+                                       variable=self.layout_var)
+        layout_check.pack(side=tk.LEFT, padx=(15, 5))
+        
+        # Streaming output: results are written to disk as each image completes
+        ttk.Label(options_frame, text="Output:").pack(side=tk.LEFT, padx=(15, 5))
+        self.output_format_var = tk.StringVar(value="combined")
+        format_combo = ttk.Combobox(options_frame, textvariable=self.output_format_var, 
+                                    values=list(FORMATS), width=9, state="readonly")
+        format_combo.pack(side=tk.LEFT)
+        
+        self.output_btn = ttk.Button(options_frame, text="📂 Output Folder", 
+                                     command=self.choose_output_dir)
+        self.output_btn.pack(side=tk.LEFT, padx=5)
+        
+        self.resume_var = tk.BooleanVar(value=True)
+        resume_check = ttk.Checkbutton(options_frame, text="Resume", variable=self.resume_var)
+        resume_check.pack(side=tk.LEFT, padx=5)
+        
+        self.report_btn = ttk.Button(options_frame, text="📊 Report", 
+                                     command=self.show_report)
+        self.report_btn.pack(side=tk.LEFT, padx=(15, 5))
         
         # Content frame with two panes
         content_frame = ttk.Frame(main_frame)
@@ -90,14 +217,10 @@ class OCRApp:
         queue_frame.columnconfigure(0, weight=1)
         queue_frame.rowconfigure(0, weight=1)
         
-        # Queue listbox with scrollbar
-        queue_scroll = ttk.Scrollbar(queue_frame)
-        queue_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        
-        self.queue_listbox = tk.Listbox(queue_frame, yscrollcommand=queue_scroll.set, 
-                                        height=15, font=("Courier", 9))
-        self.queue_listbox.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        queue_scroll.config(command=self.queue_listbox.yview)
+        # Virtualised queue list: only the visible rows are drawn, thumbnails load lazily
+        self.queue_view = QueueView(queue_frame, count=lambda: len(self.image_queue), 
+                                    row=self.queue_row)
+        self.queue_view.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         self.queue_count_label = ttk.Label(queue_frame, text="Queue: 0 images")
         self.queue_count_label.grid(row=1, column=0, columnspan=2, pady=5)
@@ -122,103 +245,428 @@ class OCRApp:
         self.progress = ttk.Progressbar(main_frame, mode='determinate')
         self.progress.grid(row=4, column=0, sticky=(tk.W, tk.E), pady=5)
         
+        # Per-stage throughput / queue depth (pipelined mode)
+        self.stage_stats_var = tk.StringVar(value="")
+        stage_stats_label = ttk.Label(main_frame, textvariable=self.stage_stats_var, 
+                                      anchor=tk.W, font=("Courier", 9))
+        stage_stats_label.grid(row=5, column=0, sticky=(tk.W, tk.E))
+        
     def add_files(self):
         files = filedialog.askopenfilenames(
             title="Select Images",
             filetypes=[
-                ("Image files", "*.png *.jpg *.jpeg *.tiff *.bmp *.gif"),
+                ("Image files", "*.png *.jpg *.jpeg *.tiff *.tif *.bmp *.gif"),
+                ("Documents", "*.pdf *.tiff *.tif"),
                 ("All files", "*.*")
             ]
         )
         
         if files:
-            for file in files:
-                if file not in self.image_queue:
-                    self.image_queue.append(file)
-                    self.queue_listbox.insert(tk.END, os.path.basename(file))
-            
-            self.update_queue_count()
-            self.status_var.set(f"Added {len(files)} image(s) to queue")
+            self.add_paths(files)
+    
+    def add_folder(self):
+        folder = filedialog.askdirectory(title="Select Folder")
+        if folder:
+            self.add_paths(find_inputs(folder))
+    
+    def add_paths(self, paths):
+        """Add files to the queue on a background thread, so even a 50k-file folder
+        returns at once; the queue view fills in as they are indexed"""
+        if self.adding or self.processing:
+            messagebox.showwarning("Busy", "Wait for the current operation to finish!")
+            return
+        self.adding = True
+        self.set_buttons_state('disabled')
+        self.status_var.set("Adding files...")
+        
+        def run():
+            added = 0
+            try:
+                for path in paths:
+                    if self.image_queue.add(path) is not None:
+                        added += 1
+                        if added % ADD_PROGRESS_EVERY == 0:
+                            self.post("queue")
+                            self.post("status", f"Adding files... {added}")
+            finally:
+                self.post("queue")
+                self.post("status", f"Added {added} image(s) to queue")
+                self.post("call", self.finish_adding)
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def finish_adding(self):
+        self.adding = False
+        self.set_buttons_state('normal')
+    
+    def queue_row(self, i):
+        """(path, label, status, status text) for row i of the queue view"""
+        path = self.image_queue.paths[i]
+        label = os.path.basename(path)
+        original = self.image_queue.original_of(i)
+        if original:
+            label += f"  (same as {os.path.basename(original)})"
+        status, detail = self.row_status.get(i, ("", ""))
+        return path, label, status, detail
+    
+    def toggle_near_duplicates(self):
+        """Applies to images added from now on"""
+        self.image_queue.near_duplicates = self.near_dup_var.get()
     
     def clear_queue(self):
         self.image_queue.clear()
-        self.queue_listbox.delete(0, tk.END)
+        self.row_status.clear()
+        self.queue_view.clear()
         self.update_queue_count()
         self.status_var.set("Queue cleared")
     
+    def choose_output_dir(self):
+        folder = filedialog.askdirectory(title="Select Output Folder", initialdir=self.output_dir)
+        if folder:
+            self.output_dir = folder
+            self.status_var.set(f"Results will be written to {folder}")
+    
     def update_queue_count(self):
         count = len(self.image_queue)
-        self.queue_count_label.config(text=f"Queue: {count} image(s)")
+        text = f"Queue: {count} image(s)"
+        if self.image_queue.duplicates:
+            text += f", {self.image_queue.duplicates} duplicate(s)"
+        self.queue_count_label.config(text=text)
+    
+    def batch_options(self):
+        """Snapshot of everything a batch needs from the UI, taken on the Tk thread"""
+        try:
+            workers = max(1, int(self.workers_var.get()))
+        except (tk.TclError, ValueError):
+            workers = ocr_engine.default_workers()
+        return {
+            "settings": self.current_settings(),
+            "workers": workers,
+            "queue": self.image_queue.snapshot(),
+            "pipeline": self.pipeline_var.get(),
+            "output_format": self.output_format_var.get(),
+            "output_dir": self.output_dir,
+            "resume": self.resume_var.get(),
+        }
+    
+    def current_settings(self):
+        try:
+            tile_height = max(0, int(self.tile_height_var.get()))
+        except (tk.TclError, ValueError):
+            tile_height = 0
+        return ocr_engine.OCRSettings(lang=self.language_var.get().strip() or "eng", 
+                                      preprocess=self.preprocess_var.get(), 
+                                      profile=self.profile_var.get(), 
+                                      normalize=self.normalize_var.get(),
+                                      tile_height=tile_height,
+                                      layout=self.layout_var.get(),
+                                      two_pass=self.two_pass_var.get(),
+                                      detect_language=self.detect_language_var.get(),
+                                      words=self.output_format_var.get() == "words")
     
     def preprocess_image(self, image_path):
         """Advanced preprocessing for better OCR accuracy"""
-        img = cv2.imread(image_path)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        contrast = clahe.apply(denoised)
-        thresh = cv2.adaptiveThreshold(contrast, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                       cv2.THRESH_BINARY, 11, 2)
-        kernel = np.ones((1, 1), np.uint8)
-        morph = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-        return morph
+        return ocr_engine.preprocess_image(image_path, self.profile_var.get())
     
     def extract_text(self, image_path):
         """Extract text from image"""
-        try:
-            if self.preprocess_var.get():
-                preprocessed = self.preprocess_image(image_path)
-                pil_image = Image.fromarray(preprocessed)
+        return ocr_engine.extract_text_stats(image_path, self.current_settings())[0]
+    
+    def process_images(self, options):
+        """Process all images in queue on a pool of worker processes or a staged pipeline.
+        
+        Runs on a background thread: options is a snapshot of the UI state taken on
+        the Tk thread, and every UI change goes through post().
+        """
+        self.post("clear")
+        self.post("stage_stats", "")
+        
+        settings = options["settings"]
+        workers = options["workers"]
+        image_queue, canonical = options["queue"]
+        
+        # Multi-page documents become one work unit per page; only page counts are read here.
+        # Duplicates share their original's pages rather than opening the file again.
+        units = []
+        remaining = {}
+        pages_of = {}
+        for i, image_path in enumerate(image_queue):
+            if canonical[i] == i:
+                pages_of[i] = [page for _, _, page in ocr_documents.expand(i, image_path)]
+            pages = pages_of[canonical[i]]
+            units.extend((i, image_path, page) for page in pages)
+            remaining[i] = len(pages)
+        
+        # Stream results to disk and journal each finished unit; with Resume on,
+        # skip anything the journal (or, failing that, the output) already has
+        if self.writer:
+            self.writer.close()
+        self.writer = make_writer(options["output_format"], options["output_dir"], 
+                                  fresh=not options["resume"], units=units)
+        journal = CheckpointJournal(os.path.join(options["output_dir"], CHECKPOINT_NAME), 
+                                    fresh=not options["resume"],
+                                    config=run_config(options["output_format"], settings))
+        already_done = journal.resume(units, self.writer)
+        if already_done:
+            for i, image_path, page in units:
+                if result_key(image_path, page) in already_done:
+                    remaining[i] -= 1
+                    if remaining[i] == 0:
+                        self.post("row", i, "done", "in output")
+            units = [u for u in units if result_key(u[1], u[2]) not in already_done]
+            self.post("text", f"Resuming: {len(already_done)} image(s)/page(s) "
+                              f"already in {options['output_dir']}\n")
+        
+        total = len(units)
+        self.post("progress", 0, total)
+        self.report = BatchReport()
+        
+        # One OCR job per distinct content and page; its result fans out to every alias
+        jobs = {}
+        for unit in units:
+            jobs.setdefault((canonical[unit[0]], unit[2]), []).append(unit)
+        aliases = {(first[0], first[2]): rest for first, *rest in jobs.values()}
+        
+        keys = {}
+        pending = []
+        done = 0
+        elapsed = {}
+        
+        def finish(i, image_path, page, text, stats=None):
+            nonlocal done
+            seconds = (stats or {}).get("timings", {}).get("total", 0.0)
+            targets = [(i, image_path)] + [(j, path) for j, path, _ in aliases.get((i, page), [])]
+            # Failures are shown but not written, so a resumed batch retries them
+            if not text.startswith(ocr_engine.ERROR_PREFIX):
+                if keys.get((i, page)):
+                    self.cache.put(keys[(i, page)], text)
+                with timed(stats, "write"):
+                    for _, path in targets:
+                        journal.mark(path, page, self.writer.write(path, page, text, stats))
             else:
-                pil_image = Image.open(image_path)
-            
-            lang = self.language_var.get()
-            custom_config = f'--oem 3 --psm 3 -l {lang}'
-            
-            text = pytesseract.image_to_string(pil_image, config=custom_config)
-            return text
-        
-        except Exception as e:
-            return f"Error processing image: {str(e)}"
+                for _, path in targets:
+                    journal.mark(path, page, ok=False)
+            self.report.add(ocr_documents.page_label(image_path, page), stats)
+            for j, path in targets:
+                done += 1
+                remaining[j] -= 1
+                elapsed[j] = elapsed.get(j, 0.0) + seconds
+                self.show_result(j, path, text, done, total, stats, page, remaining[j] == 0, 
+                                 len(image_queue), elapsed[j])
+        
+        for i, image_path, page in (job[0] for job in jobs.values()):
+            if self.cancel_event.is_set():
+                break
+            try:
+                key = self.cache.key(image_path, settings.cache_config(page), settings.preprocess) \
+                    if settings.cacheable() else None
+            except OSError:
+                key = None
+            text = self.cache.get(key) if key else None
+            if text is not None:
+                finish(i, image_path, page, text)
+                continue
+            keys[(i, page)] = key
+            pending.append((i, image_path, page))
+        
+        if pending and options["pipeline"] and not self.cancel_event.is_set():
+            pipeline = OCRPipeline(
+                settings,
+                sink=lambda item: finish(item["index"], item["path"], item["page"], 
+                                         item["text"], item["stats"]),
+                preprocess_workers=workers, recognize_workers=workers,
+                on_stats=self.show_stage_stats)
+            self.pipeline = pipeline
+            if self.cancel_event.is_set():
+                pipeline.cancel()
+            pipeline.run(pending)
+        elif pending and not self.cancel_event.is_set():
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending)),
+                                     initializer=ocr_engine.init_worker, 
+                                     initargs=settings.languages()) as pool:
+                futures = [pool.submit(ocr_engine.ocr_worker, i, image_path, settings, page)
+                           for i, image_path, page in pending]
+                self.futures = futures
+                if self.cancel_event.is_set():
+                    cancel_pending(futures)
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+                    i, image_path, text, stats = future.result()
+                    finish(i, image_path, stats.get("page"), text, stats)
+        
+        self.writer.close()
+        journal.close()
+        self.futures = []
+        self.report.finish()
+        logging.getLogger(__name__).info("batch report\n%s", self.report.format_summary())
+        self.processing = False
+        if self.cancel_event.is_set():
+            self.post("status", f"Stopped after {done}/{total} image(s)/page(s). "
+                                f"Process All with Resume ticked continues from here.")
+            return
+        self.post("status", f"Complete! Processed {total} image(s)/page(s) | {self.cache.stats()}")
+        self.post("call", messagebox.showinfo, "Complete", 
+                  f"Successfully processed {total} image(s)/page(s)!")
     
-    def process_images(self):
-        """Process all images in queue"""
-        self.processing = True
-        self.results_text.delete(1.0, tk.END)
-        
-        total = len(self.image_queue)
-        self.progress['maximum'] = total
-        
-        all_results = []
-        
-        for i, image_path in enumerate(self.image_queue):
-            filename = os.path.basename(image_path)
-            self.status_var.set(f"Processing {i+1}/{total}: {filename}")
-            self.progress['value'] = i + 1
-            self.root.update_idletasks()
-            
-            # Extract text
-            text = self.extract_text(image_path)
-            
-            # Format results
-            result = f"\n{'='*80}\n"
-            result += f"FILE: {filename}\n"
-            result += f"{'='*80}\n"
-            result += text
-            result += f"\n{'='*80}\n"
-            
-            all_results.append(result)
-            
-            # Update display
-            self.results_text.insert(tk.END, result)
+    def show_stage_stats(self, stats):
+        """Show per-stage throughput and queue depth for the running pipeline"""
+        text = self.pipeline.format_stats(stats)
+        text += f"  [bottleneck: {self.pipeline.bottleneck(stats)}]"
+        self.post("stage_stats", text)
+    
+    def show_result(self, i, image_path, text, done, total, stats=None, page=None, 
+                    file_done=True, queue_len=None, seconds=None):
+        """Append one finished image (or page) to the results view"""
+        filename = ocr_documents.page_label(image_path, page)
+        status = f"Processed {done}/{total}: {filename} | {self.cache.stats()}"
+        if stats and "profile" in stats:
+            status += f" | profile: {stats['profile']}"
+        if stats and "lang" in stats:
+            status += f" | lang {stats['lang']}"
+        if stats and stats.get("scale", 1.0) != 1.0:
+            status += f" | scale {stats['scale']:g}"
+        if stats and "strips" in stats:
+            status += f" | {stats['strips']} strips"
+        if stats and stats.get("blank"):
+            status += " | blank page skipped"
+        elif stats and "regions" in stats:
+            status += f" | {stats['regions']} regions"
+        if stats and "confidence" in stats:
+            status += f" | confidence {stats['confidence']:g} (pass {stats['passes']})"
+        if stats and "bytes_copied" in stats:
+            status += f" | {ocr_engine.format_bytes(stats['bytes_copied'])} copied"
+        self.post("status", status)
+        self.post("progress", done, total)
+        
+        position = f"#{i+1} of {queue_len or total}"
+        if stats and "lang" in stats:
+            position += f", {stats['lang']}"
+        if stats and "confidence" in stats:
+            position += f", confidence {stats['confidence']:g}"
+        result = format_block(filename, text, position)
+        self.post("text", result)
+        
+        # Mark the queue row (documents stay partial until every page is done)
+        if text.startswith(ocr_engine.ERROR_PREFIX):
+            self.post("row", i, "failed", "failed")
+        elif stats is None:
+            self.post("row", i, "cached" if file_done else "partial", "cached")
+        else:
+            detail = f"{seconds:.2f} s" if seconds is not None else ""
+            self.post("row", i, "done" if file_done else "partial", detail)
+    
+    def post(self, kind, *args):
+        """Queue a UI update from any thread; applied by drain_ui_queue on the Tk thread"""
+        self.ui_queue.put((kind, args))
+    
+    def drain_ui_queue(self):
+        """Apply pending UI updates once per frame.
+        
+        Status, progress and stage stats are coalesced to their latest value, result
+        text is inserted in one go and the queue view is redrawn at most once, so a
+        10k-image batch costs one redraw per frame rather than one per image.
+        """
+        try:
+            self.apply_ui_updates()
+        finally:
+            self.root.after(UI_FRAME_MS, self.drain_ui_queue)
+    
+    def apply_ui_updates(self):
+        status = progress = stage_stats = None
+        texts = []
+        rows = {}
+        calls = []
+        queue_changed = False
+        try:
+            for _ in range(UI_MAX_MESSAGES_PER_FRAME):
+                kind, args = self.ui_queue.get_nowait()
+                if kind == "status":
+                    status = args[0]
+                elif kind == "progress":
+                    progress = args
+                elif kind == "stage_stats":
+                    stage_stats = args[0]
+                elif kind == "text":
+                    texts.append(args[0])
+                elif kind == "row":
+                    # A document with a failed page stays failed
+                    if rows.get(args[0], self.row_status.get(args[0], ("",)))[0] != "failed":
+                        rows[args[0]] = args[1:]
+                elif kind == "queue":
+                    queue_changed = True
+                elif kind == "clear":
+                    texts.clear()
+                    rows.clear()
+                    self.row_status.clear()
+                    self.results_text.delete(1.0, tk.END)
+                    queue_changed = True
+                elif kind == "call":
+                    calls.append(args)
+        except queue.Empty:
+            pass
+        
+        if status is not None:
+            self.status_var.set(status)
+        if progress is not None:
+            self.progress['maximum'] = max(progress[1], 1)
+            self.progress['value'] = progress[0]
+        if stage_stats is not None:
+            self.stage_stats_var.set(stage_stats)
+        if rows:
+            self.row_status.update(rows)
+        if queue_changed:
+            self.update_queue_count()
+        if rows or queue_changed:
+            self.queue_view.refresh()
+        self.queue_view.poll_thumbnails()
+        
+        if texts:
+            # Keep only the last MAX_VIEW_LINES lines
+            self.results_text.insert(tk.END, "".join(texts))
+            lines = int(self.results_text.index('end-1c').split('.')[0])
+            if lines > MAX_VIEW_LINES:
+                self.results_text.delete('1.0', f"{lines - MAX_VIEW_LINES + 1}.0")
             self.results_text.see(tk.END)
-            
-            # Highlight processed item in queue
-            self.queue_listbox.itemconfig(i, {'bg': 'light green'})
         
-        self.processing = False
-        self.status_var.set(f"Complete! Processed {total} image(s)")
-        messagebox.showinfo("Complete", f"Successfully processed {total} image(s)!")
+        for func, *func_args in calls:
+            func(*func_args)
+    
+    def show_report(self):
+        """Panel with the latest batch's per-step latencies, throughput and peak memory"""
+        if not self.report:
+            messagebox.showwarning("No Report", "Process a batch first!")
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title("Batch Performance Report")
+        window.geometry("700x360")
+        
+        report_text = scrolledtext.ScrolledText(window, wrap=tk.NONE, font=("Courier", 10))
+        report_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+        
+        def refresh():
+            report_text.delete(1.0, tk.END)
+            report_text.insert(tk.END, self.report.format_summary())
+        
+        def export():
+            file_path = filedialog.asksaveasfilename(
+                defaultextension=".json",
+                filetypes=[("JSON summary", "*.json"), ("CSV per image", "*.csv")],
+                title="Export Report"
+            )
+            if file_path:
+                try:
+                    self.report.export(file_path)
+                    self.status_var.set(f"Report saved to {os.path.basename(file_path)}")
+                except Exception as e:
+                    messagebox.showerror("Error", f"Failed to export report:\n{str(e)}")
+        
+        button_row = ttk.Frame(window)
+        button_row.pack(pady=(0, 10))
+        ttk.Button(button_row, text="🔄 Refresh", command=refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_row, text="💾 Export JSON/CSV", command=export).pack(side=tk.LEFT, padx=5)
+        refresh()
     
     def start_processing(self):
         """Start processing in a separate thread"""
@@ -230,30 +678,70 @@ class OCRApp:
             messagebox.showwarning("Processing", "Already processing images!")
             return
         
+        if self.adding:
+            messagebox.showwarning("Adding", "Still adding files to the queue!")
+            return
+        
         # Disable buttons during processing
-        self.add_files_btn.config(state='disabled')
-        self.process_btn.config(state='disabled')
-        self.clear_queue_btn.config(state='disabled')
+        self.processing = True
+        self.cancel_event.clear()
+        self.set_buttons_state('disabled')
         
         # Start processing thread
-        thread = threading.Thread(target=self.process_with_cleanup)
+        thread = threading.Thread(target=self.process_with_cleanup, args=(self.batch_options(),))
         thread.daemon = True
         thread.start()
     
-    def process_with_cleanup(self):
+    def stop_processing(self):
+        """Ask the running batch to stop; what is in progress finishes and is written"""
+        if not self.processing or self.cancel_event.is_set():
+            return
+        self.cancel_event.set()
+        cancel_pending(self.futures)
+        if self.pipeline:
+            self.pipeline.cancel()
+        self.stop_btn.config(state='disabled')
+        self.status_var.set("Stopping after the images in progress...")
+    
+    def on_close(self):
+        """Closing mid-batch stops it cleanly first, so the output and journal stay intact"""
+        if self.processing:
+            if not messagebox.askyesno("Batch Running", 
+                                       "Stop the batch and quit?\n\nFinished images are saved; "
+                                       "with Resume ticked the batch continues next time."):
+                return
+            self.stop_processing()
+        self.close_when_idle()
+    
+    def close_when_idle(self):
+        if self.processing:
+            self.root.after(100, self.close_when_idle)
+            return
+        self.queue_view.close()
+        self.root.destroy()
+    
+    def process_with_cleanup(self, options):
         """Process and re-enable buttons"""
         try:
-            self.process_images()
+            self.process_images(options)
         finally:
-            self.add_files_btn.config(state='normal')
-            self.process_btn.config(state='normal')
-            self.clear_queue_btn.config(state='normal')
+            self.processing = False
+            self.post("call", self.set_buttons_state, 'normal')
+    
+    def set_buttons_state(self, state):
+        self.add_files_btn.config(state=state)
+        self.add_folder_btn.config(state=state)
+        self.process_btn.config(state=state)
+        self.clear_queue_btn.config(state=state)
+        # Stop is only available while a batch runs
+        self.stop_btn.config(state='normal' if state == 'disabled' and self.processing 
+                             else 'disabled')
     
     def save_results(self):
         """Save extracted text to file"""
         content = self.results_text.get(1.0, tk.END).strip()
         
-        if not content:
+        if not content and not self.writer:
             messagebox.showwarning("No Results", "No text to save!")
             return
         
@@ -265,14 +753,19 @@ class OCRApp:
         
         if file_path:
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
+                if self.writer:
+                    # The view only holds a tail; export the full batch from disk
+                    self.writer.export_text(file_path)
+                else:
+                    with open(file_path, 'w', encoding='utf-8') as f:
+                        f.write(content)
                 messagebox.showinfo("Saved", f"Results saved to:\n{file_path}")
                 self.status_var.set(f"Results saved to {os.path.basename(file_path)}")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to save file:\n{str(e)}")
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
     root = tk.Tk()
     app = OCRApp(root)
     root.mainloop()
@@ -0,0 +1,464 @@
+"""
+ocr_server.py
+Local OCR service: POST an image, get its text back.
+
+A small HTTP API (over TCP on localhost or a Unix socket) in front of a warm
+pool of worker processes with the configured languages preloaded, so tools
+on the same box can share one OCR engine instead of each shelling out to a
+script. Concurrent requests are queued and grouped into micro-batches: a
+batch is dispatched as soon as a worker is free and the queue is split
+across the free workers, so batches only grow (up to --max-batch, waiting
+at most --max-wait-ms) once every worker is busy and per-task overhead is
+worth amortising. The queue is bounded; when it is full requests are rejected
+with 503 and a Retry-After header instead of piling up. Everything runs
+offline.
+
+Endpoints:
+    POST /ocr?lang=eng&profile=auto&preprocess=1&layout=0&two_pass=0&format=text|json
+         body: the encoded image (PNG, JPEG, TIFF, ...)
+    GET  /metrics   request counts, latency and queue-time percentiles, batch sizes
+    GET  /health
+
+Usage:
+    python ocr_server.py --port 8765 --langs eng deu --jobs 4
+    curl --data-binary @scan.png "http://127.0.0.1:8765/ocr?format=json"
+    python ocr_server.py --unix-socket /tmp/ocr.sock
+    curl --unix-socket /tmp/ocr.sock --data-binary @scan.png http://localhost/ocr
+"""
+
+import argparse
+import dataclasses
+import json
+import logging
+import math
+import os
+import queue
+import re
+import signal
+import socketserver
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import ocr_backend
+import ocr_engine
+from ocr_metrics import percentile
+
+log = logging.getLogger("ocr_server")
+
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# Recent requests kept for the latency / queue-time percentiles
+METRICS_WINDOW = 10000
+# Tesseract language codes joined with "+"; anything else never reaches the command line
+LANG_PATTERN = re.compile(r"^[A-Za-z0-9_]+(\+[A-Za-z0-9_]+)*$")
+
+
+class Overloaded(Exception):
+    """The request queue is full"""
+
+
+class OCRRequest:
+    """One queued image and the future its handler is waiting on"""
+    __slots__ = ("data", "settings", "future", "enqueued", "dispatched")
+    
+    def __init__(self, data, settings):
+        self.data = data
+        self.settings = settings
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+        self.dispatched = None
+
+
+class ServiceMetrics:
+    """Thread-safe counters plus a sliding window of per-request timings"""
+    
+    def __init__(self, window=METRICS_WINDOW):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counts = {"requests": 0, "ok": 0, "failed": 0, "rejected": 0, "timeouts": 0}
+        self.latency_ms = deque(maxlen=window)
+        self.queue_ms = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+    
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+    
+    def record(self, request, ok):
+        latency = 1000 * (time.perf_counter() - request.enqueued)
+        with self.lock:
+            self.counts["ok" if ok else "failed"] += 1
+            self.latency_ms.append(latency)
+            self.queue_ms.append(1000 * (request.dispatched - request.enqueued))
+    
+    def record_batch(self, size):
+        with self.lock:
+            self.batch_sizes.append(size)
+    
+    def snapshot(self, queue_length):
+        def summary(values):
+            values = sorted(values)
+            if not values:
+                return None
+            return {"p50": percentile(values, 50), "p95": percentile(values, 95),
+                    "p99": percentile(values, 99), "max": values[-1]}
+        
+        with self.lock:
+            batches = list(self.batch_sizes)
+            return {
+                "uptime_s": time.time() - self.started,
+                **self.counts,
+                "queue_length": queue_length,
+                "latency_ms": summary(self.latency_ms),
+                "queue_time_ms": summary(self.queue_ms),
+                "batches": len(batches),
+                "mean_batch_size": sum(batches) / len(batches) if batches else None,
+            }
+
+
+class OCRService:
+    """Bounded request queue feeding micro-batches to a warm process pool"""
+    
+    def __init__(self, settings, langs=("eng",), jobs=None, max_batch=8, max_wait_ms=10,
+                 max_queue=64):
+        self.settings = settings
+        self.langs = tuple(langs)
+        # Languages a request may ask for; None if Tesseract can't list them
+        self.installed = ocr_backend.installed_languages()
+        self.jobs = max(1, jobs or ocr_engine.default_workers())
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = queue.Queue(maxsize=max_queue)
+        self.metrics = ServiceMetrics()
+        # One batch per worker in flight; further requests wait (and batch up) in the queue
+        self.busy = 0
+        self.slot_freed = threading.Condition()
+        self.pool = None
+        self.batcher = None
+        self.running = False
+    
+    def start(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=ocr_engine.init_worker,
+                                        initargs=self.langs)
+        # Start every worker (and load its models) now rather than on the first requests
+        for f in [self.pool.submit(ocr_engine.init_worker) for _ in range(self.jobs)]:
+            f.result()
+        self.running = True
+        self.batcher = threading.Thread(target=self._batch_loop, name="ocr-batcher", daemon=True)
+        self.batcher.start()
+        log.info("%d warm worker(s), languages: %s", self.jobs, ", ".join(self.langs))
+    
+    def close(self):
+        self.running = False
+        if self.batcher:
+            self.batcher.join()
+        if self.pool:
+            self.pool.shutdown(wait=True)
+    
+    def submit(self, data, settings=None):
+        """Queue one image; returns a Future of (text, stats). Raises Overloaded if full."""
+        self.metrics.count("requests")
+        request = OCRRequest(data, settings or self.settings)
+        try:
+            self.requests.put_nowait(request)
+        except queue.Full:
+            self.metrics.count("rejected")
+            raise Overloaded()
+        return request.future
+    
+    def _acquire_slot(self):
+        """Wait for a free worker and claim it; returns how many were free, this one included"""
+        with self.slot_freed:
+            while self.busy >= self.jobs:
+                self.slot_freed.wait()
+            free = self.jobs - self.busy
+            self.busy += 1
+            return free
+    
+    def _release_slot(self):
+        with self.slot_freed:
+            self.busy -= 1
+            self.slot_freed.notify()
+    
+    def _next_batch(self, free):
+        """Block for one request, then take this worker's share of the queue
+        
+        With other workers idle the queue is split evenly across them, so a
+        burst runs in parallel instead of as one batch. Only the last free
+        worker gathers up to max_batch, waiting up to max_wait for more.
+        """
+        try:
+            batch = [self.requests.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        if free > 1:
+            share = min(self.max_batch, math.ceil((1 + self.requests.qsize()) / free))
+            while len(batch) < share:
+                try:
+                    batch.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            return batch
+        
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.requests.get(timeout=max(0.0, remaining)) if remaining > 0
+                             else self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _batch_loop(self):
+        while self.running or not self.requests.empty():
+            batch = self._next_batch(self._acquire_slot())
+            if not batch:
+                self._release_slot()
+                continue
+            # Settings travel with the task, so requests with different options go separately
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.settings, []).append(request)
+            for n, (settings, requests) in enumerate(groups.items()):
+                if n:
+                    self._acquire_slot()
+                self._dispatch(settings, requests)
+    
+    def _dispatch(self, settings, requests):
+        now = time.perf_counter()
+        for request in requests:
+            request.dispatched = now
+        self.metrics.record_batch(len(requests))
+        try:
+            future = self.pool.submit(ocr_engine.ocr_batch_worker,
+                                      [r.data for r in requests], settings)
+        except Exception as e:
+            self._release_slot()
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        future.add_done_callback(lambda f: self._complete(requests, f))
+    
+    def _complete(self, requests, future):
+        self._release_slot()
+        try:
+            results = future.result()
+        except Exception as e:
+            for request in requests:
+                self.metrics.record(request, ok=False)
+                request.future.set_exception(e)
+            return
+        for request, (text, stats) in zip(requests, results):
+            ok = not text.startswith(ocr_engine.ERROR_PREFIX)
+            self.metrics.record(request, ok)
+            stats["queue_ms"] = 1000 * (request.dispatched - request.enqueued)
+            stats["latency_ms"] = 1000 * (time.perf_counter() - request.enqueued)
+            request.future.set_result((text, stats))
+
+
+class OCRRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end; the OCRService is on self.server.service"""
+    
+    server_version = "AdvancedOCR/1.0"
+    protocol_version = "HTTP/1.1"
+    
+    def address_string(self):
+        # Unix-socket peers have no (host, port)
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+    
+    def log_message(self, fmt, *args):
+        log.debug("%s %s", self.address_string(), fmt % args)
+    
+    def send_body(self, status, body, content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = (json.dumps(body) if content_type == "application/json" else body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        service = self.server.service
+        path = urlparse(self.path).path
+        if path == "/metrics":
+            self.send_body(200, service.metrics.snapshot(service.requests.qsize()))
+        elif path == "/health":
+            self.send_body(200, {"status": "ok", "languages": list(service.langs),
+                                 "workers": service.jobs})
+        else:
+            self.send_body(404, {"error": f"unknown path {path}"})
+    
+    def do_POST(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        if url.path != "/ocr":
+            self.send_body(404, {"error": f"unknown path {url.path}"})
+            return
+        
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self.send_body(411, {"error": "Content-Length required"})
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_body(400, {"error": "invalid Content-Length"})
+            self.close_connection = True
+            return
+        if length > MAX_BODY_BYTES:
+            self.send_body(413, {"error": f"image larger than {MAX_BODY_BYTES} bytes"})
+            self.close_connection = True
+            return
+        data = self.rfile.read(length)
+        
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            settings = request_settings(service.settings, params, service.installed)
+        except ValueError as e:
+            self.send_body(400, {"error": str(e)})
+            return
+        
+        try:
+            future = service.submit(data, settings)
+        except Overloaded:
+            self.send_body(503, {"error": "server busy, queue full"}, headers={"Retry-After": "1"})
+            return
+        try:
+            text, stats = future.result(timeout=self.server.request_timeout)
+        except FutureTimeout:
+            service.metrics.count("timeouts")
+            self.send_body(504, {"error": "timed out waiting for OCR"})
+            return
+        except Exception as e:
+            self.send_body(500, {"error": str(e)})
+            return
+        
+        timing = {"X-Queue-Time-Ms": f"{stats['queue_ms']:.1f}",
+                  "X-Latency-Ms": f"{stats['latency_ms']:.1f}"}
+        if text.startswith(ocr_engine.ERROR_PREFIX):
+            self.send_body(422, {"error": text[len(ocr_engine.ERROR_PREFIX):]}, headers=timing)
+        elif params.get("format") == "json":
+            self.send_body(200, {"text": text, "stats": stats}, headers=timing)
+        else:
+            self.send_body(200, text, "text/plain", headers=timing)
+
+
+def request_settings(base, params, installed=None):
+    """OCRSettings for one request: the server defaults overridden by query parameters.
+    
+    lang must be language codes joined with "+" (and, if installed is given,
+    each one installed); it is passed to tesseract, so nothing else gets through.
+    """
+    changes = {}
+    if "lang" in params:
+        # An unescaped "+" in a query string arrives as a space
+        lang = params["lang"].replace(" ", "+")
+        if not LANG_PATTERN.match(lang):
+            raise ValueError(f"invalid lang {lang!r}")
+        missing = [code for code in lang.split("+") if installed is not None and code not in installed]
+        if missing:
+            raise ValueError(f"language(s) not installed: {', '.join(missing)}")
+        changes["lang"] = lang
+    if "profile" in params:
+        if params["profile"] not in ocr_engine.PROFILES:
+            raise ValueError(f"unknown profile {params['profile']!r}")
+        changes["profile"] = params["profile"]
+    if "min_confidence" in params:
+        changes["min_confidence"] = float(params["min_confidence"])
+    for flag in ("preprocess", "layout", "normalize", "two_pass", "detect_language"):
+        if flag in params:
+            changes[flag] = params[flag].lower() not in ("0", "false", "no", "off")
+    return dataclasses.replace(base, **changes)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT, unix_socket=None,
+                request_timeout=120.0):
+    """HTTP server bound to host:port, or to a Unix socket path if given"""
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixHTTPServer(unix_socket, OCRRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), OCRRequestHandler)
+        server.daemon_threads = True
+    server.service = service
+    server.request_timeout = request_timeout
+    return server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Serve OCR over local HTTP.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to bind (default: %(default)s, local only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--langs", nargs="+", default=["eng"],
+                        help="languages to preload in every worker (default: eng); "
+                             "the first is the default for requests; they stay loaded only with "
+                             "tesserocr installed")
+    parser.add_argument("--detect-language", action="store_true",
+                        help="by default, detect each image's language among --langs instead of "
+                             "using the first")
+    parser.add_argument("-j", "--jobs", type=int, default=ocr_engine.default_workers(),
+                        help="worker processes (default: CPU count = %(default)s)")
+    parser.add_argument("--profile", choices=ocr_engine.PROFILES, default="auto")
+    parser.add_argument("--no-preprocess", action="store_true")
+    parser.add_argument("--max-batch", type=int, default=8,
+                        help="max images per worker task (default: %(default)s)")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0,
+                        help="how long a batch waits to fill once started (default: %(default)s)")
+    parser.add_argument("--max-queue", type=int, default=64,
+                        help="queued requests before new ones get 503 (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=120.0,
+                        help="seconds a request may wait for its result (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    
+    lang = "+".join(args.langs) if args.detect_language else args.langs[0]
+    settings = ocr_engine.OCRSettings(lang=lang, preprocess=not args.no_preprocess,
+                                      profile=args.profile, detect_language=args.detect_language)
+    service = OCRService(settings, args.langs, jobs=args.jobs, max_batch=args.max_batch,
+                         max_wait_ms=args.max_wait_ms, max_queue=args.max_queue)
+    service.start()
+    server = make_server(service, args.host, args.port, args.unix_socket, args.timeout)
+    
+    def shut_down(*_):
+        # shutdown() blocks until serve_forever returns, so call it off the main thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    
+    signal.signal(signal.SIGTERM, shut_down)
+    log.info("listening on %s", args.unix_socket or f"http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
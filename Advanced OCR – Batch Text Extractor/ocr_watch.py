@@ -0,0 +1,431 @@
+"""
+ocr_watch.py
+Watch-folder daemon: OCR scans as they are dropped into a directory.
+
+New files are picked up through inotify when the optional `inotify_simple`
+package is installed (Linux), or by polling the directory otherwise. A file
+is only processed once its size and modification time have stopped changing
+for a settle period, so half-copied scans are never read. Work runs on a
+bounded process pool, results stream to the usual writers, and every
+finished file is appended to a durable index so a restart skips everything
+already done (a file is redone only if it has changed since).
+
+Usage:
+    python ocr_watch.py /srv/scans/inbox -o /srv/scans/text --format jsonl --jobs 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import ocr_documents
+import ocr_engine
+from ocr_cache import OCRCache, DEFAULT_MAX_BYTES
+from ocr_checkpoint import file_signature
+from ocr_metrics import timed
+from ocr_output import FORMATS, make_writer
+
+try:
+    import inotify_simple
+except ImportError:  # optional: fall back to polling
+    inotify_simple = None
+
+log = logging.getLogger("ocr_watch")
+
+INDEX_NAME = ".ocr_watch_index.jsonl"
+# Longest the main loop blocks while work is in flight
+TICK = 0.25
+
+
+def is_input(path):
+    name = os.path.basename(path)
+    return (not name.startswith(".") and name.lower().endswith(ocr_engine.INPUT_EXTENSIONS)
+            and os.path.isfile(path))
+
+
+class ProcessedIndex:
+    """Append-only record of finished files and the signature they had when processed"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line from a crash; everything before it is intact
+                        break
+                    self.entries[entry["path"]] = (entry["size"], entry["mtime_ns"])
+        self.file = open(path, 'a', encoding='utf-8')
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def is_done(self, path, signature):
+        return self.entries.get(os.path.abspath(path)) == tuple(signature)
+    
+    def mark(self, path, signature, ok=True):
+        """Record a finished file; fsynced so a crash right after can't lose it"""
+        path = os.path.abspath(path)
+        self.entries[path] = tuple(signature)
+        self.file.write(json.dumps({"path": path, "size": signature[0],
+                                    "mtime_ns": signature[1], "ok": ok}) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+    
+    def close(self):
+        self.file.close()
+
+
+class PollingWatcher:
+    """Reports every input file in the directory on each poll"""
+    
+    def __init__(self, directory, interval=2.0):
+        self.directory = directory
+        self.interval = interval
+        self.next_scan = time.monotonic() + interval
+    
+    def changes(self, timeout):
+        """Wait up to timeout; returns the directory listing if a scan fell due, else []"""
+        wait_for = self.next_scan - time.monotonic()
+        if wait_for > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0.0, wait_for))
+        self.next_scan = time.monotonic() + self.interval
+        return scan(self.directory)
+    
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Reports files created, written or moved into the directory, as the kernel sees them"""
+    
+    def __init__(self, directory):
+        self.directory = directory
+        flags = inotify_simple.flags
+        self.inotify = inotify_simple.INotify()
+        self.inotify.add_watch(directory, flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE |
+                               flags.MOVED_TO)
+    
+    def changes(self, timeout):
+        events = self.inotify.read(timeout=int(timeout * 1000))
+        paths = {os.path.join(self.directory, event.name) for event in events if event.name}
+        return [path for path in paths if is_input(path)]
+    
+    def close(self):
+        self.inotify.close()
+
+
+def scan(directory):
+    """Input files currently in the directory (not recursive)"""
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError as e:
+        log.warning("cannot list %s: %s", directory, e)
+        return []
+    return [path for path in (os.path.join(directory, name) for name in names) if is_input(path)]
+
+
+def make_watcher(directory, poll_interval=2.0, use_inotify=True):
+    if use_inotify and inotify_simple is not None:
+        try:
+            return InotifyWatcher(directory)
+        except OSError as e:
+            log.warning("inotify unavailable (%s); polling every %.1fs", e, poll_interval)
+    return PollingWatcher(directory, poll_interval)
+
+
+class FolderWatcher:
+    """Debounces new files in a directory and OCRs them on a bounded process pool"""
+    
+    def __init__(self, directory, settings, writer, index, jobs=None, settle=2.0,
+                 poll_interval=2.0, cache=None, use_inotify=True):
+        self.directory = directory
+        self.settings = settings
+        self.writer = writer
+        self.index = index
+        self.jobs = max(1, jobs or ocr_engine.default_workers())
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.cache = cache
+        self.use_inotify = use_inotify
+        
+        self.settling = {}      # path -> (signature, time it was last seen changing)
+        self.ready = {}         # path -> signature, settled and waiting for a worker (FIFO)
+        self.pages = deque()    # (path, page) units of started files not yet submitted
+        self.in_flight = {}     # future -> (path, page, cache key)
+        self.files = {}         # path -> {"signature", "remaining", "ok"} for files being OCR'd
+        self.suspects = set()   # (path, page) units in flight when a worker died
+        self.broken = False     # the pool lost a worker and must be replaced
+        self.processed = 0
+        self.failed = 0
+        self.running = False
+    
+    def stop(self):
+        """Stop picking up new files; work already submitted is finished first"""
+        self.running = False
+    
+    def offer(self, paths, now):
+        """Start settling any path that isn't already done, queued or in progress"""
+        for path in paths:
+            if path in self.settling or path in self.ready or path in self.files:
+                continue
+            try:
+                signature = file_signature(path)
+            except OSError:
+                continue
+            if not self.index.is_done(path, signature):
+                self.settling[path] = (signature, now)
+    
+    def check_settled(self, now):
+        """Move files whose size and mtime have been stable for `settle` seconds to ready"""
+        for path, (signature, since) in list(self.settling.items()):
+            try:
+                current = file_signature(path)
+            except OSError:
+                # Deleted or renamed away before it settled
+                del self.settling[path]
+                continue
+            if current != signature:
+                self.settling[path] = (current, now)
+            elif now - since >= self.settle:
+                del self.settling[path]
+                self.ready[path] = signature
+    
+    def submit_ready(self, pool):
+        """Hand ready files to the pool, keeping at most 2 units per worker in flight.
+        
+        A document's pages are queued and submitted as slots free up, so a
+        500-page PDF never has more pages in flight than a batch of images.
+        Units that were in flight when a worker died run alone, so a crash
+        can be pinned on the unit that caused it.
+        """
+        while not self.broken and len(self.in_flight) < 2 * self.jobs:
+            if any(unit[:2] in self.suspects for unit in self.in_flight.values()):
+                return
+            if self.pages and self.pages[0] in self.suspects and self.in_flight:
+                return
+            if not self.pages:
+                if not self.ready:
+                    return
+                path = next(iter(self.ready))
+                signature = self.ready.pop(path)
+                try:
+                    units = ocr_documents.expand(0, path)
+                except OSError as e:
+                    log.warning("%s went away before OCR: %s", path, e)
+                    continue
+                self.files[path] = {"signature": signature, "remaining": len(units), "ok": True}
+                self.pages.extend((unit_path, page) for _, unit_path, page in units)
+                continue
+            
+            path, page = self.pages.popleft()
+            key = None
+            if self.cache:
+                try:
+                    key = self.cache.key(path, self.settings.cache_config(page),
+                                         self.settings.preprocess)
+                except OSError as e:
+                    log.warning("%s went away before OCR: %s", path, e)
+                    self.drop(path)
+                    continue
+                text = self.cache.get(key)
+                if text is not None:
+                    self.finish(path, page, text, None)
+                    continue
+            try:
+                future = pool.submit(ocr_engine.ocr_worker, 0, path, self.settings, page)
+            except BrokenProcessPool:
+                self.pages.appendleft((path, page))
+                self.broken = True
+                return
+            self.in_flight[future] = (path, page, key)
+    
+    def drop(self, path):
+        """Forget a file that vanished: its queued pages go, and it isn't indexed, so it
+        is picked up again if it comes back"""
+        self.pages = deque(unit for unit in self.pages if unit[0] != path)
+        self.files.pop(path, None)
+    
+    def collect(self, timeout):
+        """Wait up to timeout for submitted units and write whatever finished"""
+        if not self.in_flight:
+            return
+        finished, _ = wait(list(self.in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in finished:
+            path, page, key = self.in_flight.pop(future)
+            try:
+                _, _, text, stats = future.result()
+            except BrokenProcessPool as e:
+                # A worker died (killed, out of memory, crashed in native code) and took every
+                # unit in flight with it; rerun each alone on a fresh pool, and only fail one
+                # that crashes a worker by itself
+                self.broken = True
+                if (path, page) not in self.suspects:
+                    self.suspects.add((path, page))
+                    self.pages.appendleft((path, page))
+                    continue
+                text, stats = f"{ocr_engine.ERROR_PREFIX}worker crashed: {e}", {}
+            except Exception as e:
+                text, stats = f"{ocr_engine.ERROR_PREFIX}{e}", {}
+            if self.cache and not text.startswith(ocr_engine.ERROR_PREFIX):
+                self.cache.put(key, text)
+            self.finish(path, page, text, stats)
+    
+    def finish(self, path, page, text, stats):
+        """Write one unit; once every page of its file is done, record the file in the index"""
+        label = ocr_documents.page_label(path, page)
+        state = self.files.get(path)
+        if state is None:
+            # A page of a file dropped while this one was in flight
+            return
+        self.suspects.discard((path, page))
+        if text.startswith(ocr_engine.ERROR_PREFIX):
+            state["ok"] = False
+            log.error("FAILED %s: %s", label, text)
+        else:
+            with timed(stats, "write"):
+                out_path = self.writer.write(path, page, text, stats)
+            log.info("%s -> %s%s", label, out_path, " (cached)" if stats is None else "")
+        
+        state["remaining"] -= 1
+        if state["remaining"] == 0:
+            del self.files[path]
+            # Failed files are indexed too, so a corrupt scan isn't retried forever;
+            # replacing the file changes its signature and queues it again
+            self.index.mark(path, state["signature"], ok=state["ok"])
+            if state["ok"]:
+                self.processed += 1
+            else:
+                self.failed += 1
+    
+    def make_pool(self):
+        """Start a worker pool; called again to replace one that lost a worker"""
+        return ProcessPoolExecutor(max_workers=self.jobs, initializer=ocr_engine.init_worker,
+                                   initargs=self.settings.languages())
+    
+    def run(self, once=False):
+        """Watch until stop() (or, with once, until the files present at start are done)"""
+        watcher = make_watcher(self.directory, self.poll_interval, self.use_inotify)
+        log.info("watching %s with %s (%d job(s), %d file(s) already indexed)", self.directory,
+                 type(watcher).__name__, self.jobs, len(self.index))
+        self.running = True
+        self.offer(scan(self.directory), time.monotonic())
+        pool = self.make_pool()
+        try:
+            while self.running or self.in_flight:
+                # Once every unit of a broken pool has failed out (and been requeued), replace it
+                if self.broken and not self.in_flight:
+                    log.warning("a worker process died; restarting the pool")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self.make_pool()
+                    self.broken = False
+                
+                self.check_settled(time.monotonic())
+                if self.running:
+                    self.submit_ready(pool)
+                if once and not (self.settling or self.ready or self.pages or self.in_flight):
+                    break
+                
+                self.collect(TICK)
+                if self.running and not once:
+                    # Don't block on the folder while results are waiting to be written;
+                    # otherwise wait briefly if files are settling, else a full interval
+                    if self.in_flight:
+                        timeout = 0
+                    elif self.settling:
+                        timeout = min(TICK, self.settle)
+                    else:
+                        timeout = self.poll_interval
+                    self.offer(watcher.changes(timeout), time.monotonic())
+                elif not self.in_flight:
+                    time.sleep(TICK)
+        finally:
+            pool.shutdown(wait=True)
+            watcher.close()
+        log.info("stopped: %d file(s) processed, %d failed", self.processed, self.failed)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Watch a folder and OCR scans as they arrive.")
+    parser.add_argument("directory", help="folder to watch (not recursive)")
+    parser.add_argument("-o", "--output-dir",
+                        help="where results go (txt default: next to each image)")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="txt",
+                        help="output format (default: %(default)s)")
+    parser.add_argument("--index",
+                        help=f"processed-file index (default: {INDEX_NAME} in the output "
+                             "or watched folder)")
+    parser.add_argument("-j", "--jobs", type=int, default=ocr_engine.default_workers(),
+                        help="worker processes (default: CPU count = %(default)s)")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="seconds a file must stay unchanged before it is read "
+                             "(default: %(default)s)")
+    parser.add_argument("--poll-interval", type=float, default=2.0,
+                        help="seconds between directory scans when polling (default: %(default)s)")
+    parser.add_argument("--poll", action="store_true",
+                        help="always poll, even if inotify is available")
+    parser.add_argument("--once", action="store_true",
+                        help="process what is in the folder now, then exit")
+    parser.add_argument("-l", "--lang", default="eng",
+                        help="Tesseract language code, e.g. eng, deu, eng+fra")
+    parser.add_argument("--detect-language", action="store_true",
+                        help="treat --lang as candidates and read each page with the one detected")
+    parser.add_argument("--no-preprocess", action="store_true",
+                        help="skip OpenCV enhancement and OCR the raw image")
+    parser.add_argument("--profile", choices=ocr_engine.PROFILES, default="auto",
+                        help="preprocessing profile (default: %(default)s)")
+    parser.add_argument("--cache-dir",
+                        help="OCR result cache directory (default: ~/.cache/advanced_ocr)")
+    parser.add_argument("--cache-size-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024))
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always re-run OCR, never read or write the cache")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    
+    if not os.path.isdir(args.directory):
+        print(f"Not a directory: {args.directory}", file=sys.stderr)
+        return 1
+    
+    settings = ocr_engine.OCRSettings(lang=args.lang, preprocess=not args.no_preprocess,
+                                      profile=args.profile, detect_language=args.detect_language,
+                                      words=args.format == "words")
+    cache = None if args.no_cache or not settings.cacheable() else \
+        OCRCache(args.cache_dir, args.cache_size_mb * 1024 * 1024)
+    index = ProcessedIndex(args.index or
+                           os.path.join(args.output_dir or args.directory, INDEX_NAME))
+    writer = make_writer(args.format, args.output_dir)
+    watcher = FolderWatcher(args.directory, settings, writer, index, jobs=args.jobs,
+                            settle=args.settle, poll_interval=args.poll_interval, cache=cache,
+                            use_inotify=not args.poll)
+    
+    # SIGINT/SIGTERM finish what is in flight, then exit cleanly
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: watcher.stop())
+    try:
+        watcher.run(once=args.once)
+    finally:
+        writer.close()
+        index.close()
+    return 1 if watcher.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+ocr_words.py
+Word boxes from Tesseract's data output, kept as packed NumPy columns.
+
+A page's words are one structured array (box, confidence, block/paragraph/
+line/word numbers) plus a single UTF-8 blob holding the word strings, so a
+page of 2000 words is two allocations rather than 2000 dicts. They come
+from the same TSV output the text is rebuilt from, i.e. the same single
+recognition pass.
+
+On disk (format "words") the rows of every page are appended to one .npy
+file whose header is rewritten as it grows, the strings to one blob, and
+each page gets a line in an index file:
+
+    words.npy         WORD_DTYPE rows; np.load(..., mmap_mode="r") reads it lazily
+    words_text.bin    UTF-8 word strings, addressed by text_start/text_len
+    words_pages.jsonl one record per page: path, page, first row, count, text
+
+Optional dependency for Parquet export:
+    pip install pyarrow
+"""
+
+import json
+import os
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+WORD_DTYPE = np.dtype([
+    ("page_id", "<u4"),     # line number in words_pages.jsonl
+    ("block", "<u2"),
+    ("par", "<u2"),
+    ("line", "<u2"),
+    ("word", "<u2"),
+    ("left", "<i4"),
+    ("top", "<i4"),
+    ("width", "<i4"),
+    ("height", "<i4"),
+    ("conf", "<f4"),
+    ("text_start", "<u8"),  # byte offset into the string blob
+    ("text_len", "<u4"),
+])
+
+ROWS_NAME = "words.npy"
+TEXT_NAME = "words_text.bin"
+PAGES_NAME = "words_pages.jsonl"
+
+# Fixed .npy header size, so the row count can be rewritten in place
+NPY_HEADER_BYTES = 512
+PARQUET_ROW_GROUP = 1 << 20
+
+
+class WordBoxes:
+    """The words of one page (or part of a page): rows of WORD_DTYPE plus their string blob"""
+    
+    def __init__(self, rows=None, blob=b""):
+        self.rows = rows if rows is not None else np.zeros(0, WORD_DTYPE)
+        self.blob = blob
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    @property
+    def conf(self):
+        return self.rows["conf"]
+    
+    def words(self):
+        """The word strings (decoded on demand; the boxes never need them)"""
+        return [self.blob[start:start + n].decode("utf-8")
+                for start, n in zip(self.rows["text_start"].tolist(), self.rows["text_len"].tolist())]
+    
+    def shifted(self, dx, dy):
+        """Copy with boxes moved by (dx, dy), e.g. from a region crop into page coordinates"""
+        if not dx and not dy:
+            return self
+        rows = self.rows.copy()
+        rows["left"] += dx
+        rows["top"] += dy
+        return WordBoxes(rows, self.blob)
+    
+    def scaled(self, factor):
+        """Copy with boxes multiplied by factor (undoing the resolution normalisation)"""
+        if factor == 1.0:
+            return self
+        rows = self.rows.copy()
+        for column in ("left", "top", "width", "height"):
+            rows[column] = np.rint(rows[column] * factor)
+        return WordBoxes(rows, self.blob)
+    
+    @classmethod
+    def concat(cls, parts):
+        """One table from several parts (regions, strips) in reading order.
+        
+        Block numbers restart at 1 in every part, so each part's blocks are
+        renumbered after the previous part's to stay distinct.
+        """
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls()
+        if len(parts) == 1:
+            return parts[0]
+        rows = np.concatenate([part.rows for part in parts])
+        start = 0
+        block = 0
+        for part, stop in zip(parts, np.cumsum([len(part) for part in parts])):
+            chunk = rows[stop - len(part):stop]
+            chunk["block"] += block
+            chunk["text_start"] += start
+            block = int(chunk["block"].max())
+            start += len(part.blob)
+        return cls(rows, b"".join(part.blob for part in parts))
+
+
+def from_tsv(tsv):
+    """Parse Tesseract TSV output into (text, WordBoxes).
+    
+    The text is rebuilt from the words: one line per text line, a blank line
+    between paragraphs. Empty words and non-word rows are dropped.
+    """
+    lines = []
+    numbers = []
+    confs = []
+    words = []
+    last_line = last_par = None
+    for row in tsv.splitlines()[1:]:
+        fields = row.split('\t')
+        if len(fields) < 12 or fields[0] != '5':    # level 5 = word
+            continue
+        word = fields[11]
+        conf = float(fields[10])
+        if not word.strip() or conf < 0:
+            continue
+        par = tuple(fields[1:4])
+        line = tuple(fields[1:5])
+        if line != last_line:
+            if last_par is not None and par != last_par:
+                lines.append("")
+            lines.append(word)
+        else:
+            lines[-1] += " " + word
+        last_line, last_par = line, par
+        numbers.append(fields[2:10])    # block, par, line, word, left, top, width, height
+        confs.append(conf)
+        words.append(word.encode("utf-8"))
+    
+    text = "\n".join(lines) + "\n" if lines else ""
+    rows = np.zeros(len(words), WORD_DTYPE)
+    if words:
+        numbers = np.array(numbers, np.int64)
+        for k, column in enumerate(("block", "par", "line", "word", "left", "top", "width", "height")):
+            rows[column] = numbers[:, k]
+        rows["conf"] = confs
+        lengths = np.fromiter(map(len, words), np.int64, len(words))
+        rows["text_len"] = lengths
+        rows["text_start"] = np.cumsum(lengths) - lengths
+    return text, WordBoxes(rows, b"".join(words))
+
+
+def page_words(stats):
+    """The page's words in original image coordinates, from the parts in stats["words"]"""
+    words = WordBoxes.concat(stats.get("words", ()))
+    scale = stats.get("scale", 1.0)
+    return words.scaled(1.0 / scale) if scale else words
+
+
+def npy_header(count):
+    """.npy v1.0 header for `count` rows, padded to NPY_HEADER_BYTES"""
+    header = repr({"descr": np.lib.format.dtype_to_descr(WORD_DTYPE),
+                   "fortran_order": False, "shape": (count,)}).encode("latin1")
+    preamble = np.lib.format.MAGIC_PREFIX + b"\x01\x00"
+    size = NPY_HEADER_BYTES - len(preamble) - 2
+    return preamble + size.to_bytes(2, "little") + header.ljust(size - 1) + b"\n"
+
+
+def load_words(output_dir):
+    """(rows, blob, pages) of a words output; rows and blob are memory-mapped, not read"""
+    rows = np.load(os.path.join(output_dir, ROWS_NAME), mmap_mode="r")
+    text_path = os.path.join(output_dir, TEXT_NAME)
+    if os.path.getsize(text_path):
+        blob = np.memmap(text_path, np.uint8, mode="r")
+    else:
+        blob = np.zeros(0, np.uint8)
+    with open(os.path.join(output_dir, PAGES_NAME), 'r', encoding='utf-8') as f:
+        pages = [json.loads(line) for line in f]
+    return rows, blob, pages
+
+
+def export_parquet(output_dir, dest=None, row_group=PARQUET_ROW_GROUP):
+    """Convert a words output to one Parquet file (default words.parquet beside it).
+    
+    Streams row groups of row_group words from the memory-mapped columns, so
+    memory does not grow with the size of the output. Needs pyarrow.
+    """
+    if pyarrow is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    pa = pyarrow
+    rows, blob, pages = load_words(output_dir)
+    dest = dest or os.path.join(output_dir, "words.parquet")
+    paths = pa.array([page["path"] for page in pages], pa.string())
+    page_numbers = np.array([-1 if page.get("page") is None else page["page"] for page in pages],
+                            np.int32)
+    columns = [name for name in WORD_DTYPE.names if not name.startswith("text_")]
+    schema = pa.schema([("path", pa.dictionary(pa.int32(), pa.string())), ("page", pa.int32())] +
+                       [(name, pa.from_numpy_dtype(WORD_DTYPE[name])) for name in columns] +
+                       [("text", pa.large_string())])
+    
+    with pa.parquet.ParquetWriter(dest, schema) as writer:
+        for start in range(0, len(rows), row_group):
+            chunk = np.asarray(rows[start:start + row_group])
+            page_id = chunk["page_id"].astype(np.int32)
+            arrays = [pa.DictionaryArray.from_arrays(pa.array(page_id), paths),
+                      pa.array(page_numbers[page_id], mask=page_numbers[page_id] < 0)]
+            arrays += [pa.array(np.ascontiguousarray(chunk[name])) for name in columns]
+            # Words of consecutive rows are contiguous in the blob: one slice, no per-word strings
+            first = int(chunk["text_start"][0])
+            offsets = np.append(chunk["text_start"], chunk["text_start"][-1] + chunk["text_len"][-1])
+            offsets = (offsets - first).astype(np.int64)
+            data = np.asarray(blob[first:first + int(offsets[-1])])
+            arrays.append(pa.LargeStringArray.from_buffers(len(chunk), pa.py_buffer(offsets),
+                                                           pa.py_buffer(data)))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    return dest